@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル共通のメンバー取得キャッシュ
+
+guild.fetch_member はREST API呼び出し（レート制限あり）なので、
+ゲートウェイのキャッシュ（guild.get_member）を優先し、見つからない場合のみRESTで取得する。
+RESTで取得したメンバーはTTL付きのLRUキャッシュに保存し、
+同じユーザーへの同時取得は1回のREST呼び出しにまとめる。
+
+使い方:
+    from member_cache import MemberResolver
+
+    member_resolver = MemberResolver()
+    member = await member_resolver.resolve(guild, user_id)  # 見つからない場合は None
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+
+class MemberResolver:
+    """TTL + LRU のメンバー取得キャッシュ"""
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl  # RESTで取得したメンバーを保持する秒数
+        self._cache = OrderedDict()  # (guild_id, user_id) -> (有効期限, Member)
+        self._inflight = {}  # (guild_id, user_id) -> 取得中のTask
+
+        # 統計情報
+        self.gateway_hits = 0  # guild.get_member で見つかった回数
+        self.cache_hits = 0  # このキャッシュで見つかった回数
+        self.misses = 0  # RESTで取得した回数
+        self.coalesced = 0  # 取得中のRESTに相乗りした回数
+
+    async def resolve(self, guild, user_id):
+        """メンバーを取得（サーバーにいない場合は None）
+
+        discord.NotFound 以外のエラー（Forbidden など）はそのまま送出する。
+        """
+        # ゲートウェイのキャッシュを優先
+        member = guild.get_member(user_id)
+        if member:
+            self.gateway_hits += 1
+            return member
+
+        key = (guild.id, user_id)
+        cached = self._cache.get(key)
+        if cached:
+            expires_at, member = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return member
+            del self._cache[key]
+
+        # 同じユーザーを取得中なら、その結果を待つ
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(guild, user_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # 待っている側がキャンセルされても取得自体は続ける
+        return await asyncio.shield(task)
+
+    async def _fetch(self, guild, user_id):
+        """RESTでメンバーを取得してキャッシュに保存"""
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+
+        key = (guild.id, user_id)
+        self._cache[key] = (time.monotonic() + self.ttl, member)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return member
+
+    def invalidate(self, guild_id, user_id):
+        """キャッシュから削除（ロール変更後など）"""
+        self._cache.pop((guild_id, user_id), None)
+
+    def stats(self):
+        """ヒット/ミスの統計情報を取得"""
+        lookups = self.gateway_hits + self.cache_hits + self.misses + self.coalesced
+        hits = self.gateway_hits + self.cache_hits + self.coalesced
+        return {
+            'lookups': lookups,
+            'gateway_hits': self.gateway_hits,
+            'cache_hits': self.cache_hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'cached': len(self._cache),
+        }
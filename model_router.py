@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル共通のモデルルーター（サーキットブレーカー・応答速度による選択・ヘッジリクエスト）
+
+主モデルが落ちている間も毎回タイムアウトまで待ってからフォールバックすると、すべての応答が遅くなる。
+モデルごとにサーキットブレーカーを持ち、続けて失敗したモデルはしばらく使わない（一定時間後に1件だけ試す）。
+失敗として数えるのはタイムアウト・接続エラー・429・5xx のみ（不正なパラメーターなど、リクエスト側の誤りでは止めない）。
+応答開始までの時間を記録し、優先するモデルが大幅に遅くなっている間は速いモデルを先に使う。
+最初のモデルが普段（p95）より応答開始に時間がかかっている場合は次のモデルにも同時に送り（ヘッジ）、
+先に応答を始めた方を使ってもう一方は取り消す。
+
+使い方:
+    from model_router import ModelRoute, ModelRouter
+
+    async def stream_chat(model, request):
+        ...  # 生成された文字列を順に yield する
+
+    model_router = ModelRouter([
+        ModelRoute('gpt-4.1', stream_responses),  # 優先する順に並べる
+        ModelRoute('gpt-4', stream_chat),
+    ])
+
+    async for delta in model_router.stream(request):
+        ...
+"""
+import asyncio
+import time
+from collections import deque
+
+import httpx
+import openai
+
+# サーキットブレーカー
+CIRCUIT_FAILURE_THRESHOLD = 3  # 続けてこの回数失敗したらモデルを使わない（open）
+CIRCUIT_OPEN_SECONDS = 30.0  # 使わない時間。経過後に1件だけ試し（half-open）、成功すれば元に戻す
+CIRCUIT_MAX_OPEN_SECONDS = 300.0  # 試しても失敗が続く場合は使わない時間を倍にしていき、この秒数で止める
+
+# 応答開始までの時間の統計
+LATENCY_SAMPLES = 200  # モデルごとに保持する件数
+LATENCY_WINDOW = 10 * 60  # この秒数より古い記録は使わない（遅かったモデルもいずれ優先順に戻す）
+LATENCY_SLACK = 1.5  # 優先するモデルの p50 が、後のモデルのこの倍より遅い間は後のモデルを先に使う
+LATENCY_MIN_SAMPLES = 5  # 応答速度で順番を入れ替えるのに必要な記録数
+
+# ヘッジリクエスト
+HEDGE_MIN_SAMPLES = 20  # p95 から待ち時間を決めるのに必要な記録数（足りない間は HEDGE_DEFAULT_DELAY）
+HEDGE_DEFAULT_DELAY = 8.0  # 次のモデルにも送るまでの待ち時間（秒）
+HEDGE_MIN_DELAY = 1.0  # 待ち時間の下限（秒）
+
+
+def percentile(values, rate):
+    """values のパーセンタイル（空なら None）"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * rate))]
+
+
+def is_outage(error):
+    """モデル側の障害とみなすエラーか（タイムアウト・接続エラー・429・5xx）"""
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """続けて失敗したモデルを一定時間使わないようにする（closed → open → half-open → closed）"""
+
+    def __init__(self):
+        self.state = 'closed'
+        self.failures = 0  # 続けて失敗した回数
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.opened_at = 0.0
+        self.probing = False  # half-open で試している最中
+
+    def available(self, now):
+        """このモデルにリクエストを送れるか"""
+        if self.state == 'open' and now - self.opened_at >= self.open_seconds:
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            return not self.probing
+        return self.state == 'closed'
+
+    def acquire(self, now):
+        """リクエストを送る前に呼ぶ（送れない場合は False）。half-open なら試すのは1件だけ"""
+        if not self.available(now):
+            return False
+        if self.state == 'half_open':
+            self.probing = True
+        return True
+
+    def release(self):
+        """結果を記録せずに終わった（ヘッジで取り消した）リクエスト"""
+        self.probing = False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.probing = False
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.state == 'half_open':
+            # 試したリクエストも失敗したので、使わない時間を延ばす
+            self.open_seconds = min(self.open_seconds * 2, CIRCUIT_MAX_OPEN_SECONDS)
+        if self.state == 'half_open' or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self.state = 'open'
+            self.opened_at = now
+        self.probing = False
+
+
+class ModelRoute:
+    """ルーターが使うモデル（stream(model, request) は生成された文字列を順に返す非同期ジェネレーター）"""
+
+    def __init__(self, model, stream):
+        self.model = model
+        self.stream = stream
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # (記録した時刻, 応答開始までの秒数)
+        self.lower_bounds = deque(maxlen=LATENCY_SAMPLES)  # (記録した時刻, ヘッジで負けて取り消すまでの秒数)
+
+        # 統計情報
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0  # ヘッジとして送った回数
+        self.cancelled = 0  # もう一方が先に応答を始めたので取り消した回数
+
+    def recent_latencies(self, now):
+        """LATENCY_WINDOW 以内の応答開始までの秒数"""
+        return [latency for recorded_at, latency in self.latencies if now - recorded_at <= LATENCY_WINDOW]
+
+    def recent_lower_bounds(self, now):
+        """LATENCY_WINDOW 以内の、ヘッジで負けたリクエストの経過時間（応答開始までの時間の下限）"""
+        return [elapsed for recorded_at, elapsed in self.lower_bounds if now - recorded_at <= LATENCY_WINDOW]
+
+
+class ModelRouter:
+    """優先順のモデルに、サーキットブレーカー・応答速度・ヘッジを考慮してリクエストを送る"""
+
+    def __init__(self, routes, hedge=True):
+        self.routes = routes  # 優先する順
+        self.hedge = hedge
+
+    def select(self, now):
+        """リクエストを送るモデルの順番（サーキットブレーカーが open のモデルは除く）"""
+        candidates = [route for route in self.routes if route.breaker.available(now)]
+        if len(candidates) < 2:
+            return candidates
+
+        # 優先するモデルが後のモデルより大幅に遅い間は、速いモデルを先にする
+        # （ヘッジで負けた経過時間は、遅いことの根拠として優先するモデルの側にだけ使う）
+        first = candidates[0]
+        first_p50 = self._demotion_p50(first, now)
+        for route in candidates[1:]:
+            p50 = self._p50(route, now)
+            if first_p50 and p50 and first_p50 > p50 * LATENCY_SLACK:
+                first, first_p50 = route, p50
+        candidates.remove(first)
+        return [first, *candidates]
+
+    def _p50(self, route, now):
+        latencies = route.recent_latencies(now)
+        return percentile(latencies, 0.50) if len(latencies) >= LATENCY_MIN_SAMPLES else None
+
+    def _demotion_p50(self, route, now):
+        """順番を下げるかの判断に使う p50
+
+        ヘッジで負けたリクエストの経過時間は実際の応答開始までの時間より短いので、
+        実測の p50 より長いもの（遅いことが確かなもの）だけを実測に加える。
+        いつもヘッジで負ける遅いモデルは実測がなくても順番を下げられ、速く見えることはない。
+        """
+        latencies = route.recent_latencies(now)
+        real_p50 = percentile(latencies, 0.50)
+        samples = latencies + [
+            elapsed for elapsed in route.recent_lower_bounds(now)
+            if real_p50 is None or elapsed > real_p50
+        ]
+        return percentile(samples, 0.50) if len(samples) >= LATENCY_MIN_SAMPLES else None
+
+    def hedge_delay(self, route, now):
+        """次のモデルにも送るまでの待ち時間（普段の応答開始までの時間の p95）"""
+        latencies = route.recent_latencies(now)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, percentile(latencies, 0.95))
+
+    async def stream(self, request):
+        """リクエストを送り、最初に応答を始めたモデルの生成した文字列を順に返す
+
+        応答を始める前に失敗したら次のモデルに送る。応答を始めた後の失敗はそのまま送出する
+        （返信済みの内容と食い違わないように、別のモデルでやり直さない）。
+        """
+        remaining = self.select(time.monotonic())
+        attempts = {}  # 最初の文字列を待っているTask -> (ModelRoute, ジェネレーター, 送信した時刻)
+        errors = []
+        hedged = False
+
+        def launch():
+            """次のモデルにリクエストを送る（送れるモデルがなければ False）"""
+            while remaining:
+                route = remaining.pop(0)
+                if not route.breaker.acquire(time.monotonic()):
+                    continue
+                route.requests += 1
+                generator = route.stream(route.model, request)
+                task = asyncio.ensure_future(generator.__anext__())
+                attempts[task] = (route, generator, time.monotonic())
+                return True
+            return False
+
+        winner = None
+        try:
+            launch()
+            while attempts and winner is None:
+                # 最初のモデルの応答開始が遅ければ、次のモデルにも送る
+                timeout = None
+                if self.hedge and not hedged and remaining and len(attempts) == 1:
+                    route, _, sent_at = next(iter(attempts.values()))
+                    timeout = max(0.0, sent_at + self.hedge_delay(route, sent_at) - time.monotonic())
+
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if launch():
+                        route = next(reversed(attempts.values()))[0]
+                        route.hedges += 1
+                    continue
+
+                for task in done:
+                    route, generator, sent_at = attempts.pop(task)
+                    if winner is not None:
+                        # 同時に応答を始めたもう一方は取り消す
+                        attempts[task] = (route, generator, sent_at)
+                        continue
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = ''
+                    except Exception as e:
+                        self._record_error(route, e)
+                        errors.append((route.model, e))
+                        print(f'OpenAI APIエラー ({route.model}): {e}')
+                        continue
+                    now = time.monotonic()
+                    route.latencies.append((now, now - sent_at))
+                    winner = (route, generator, first)
+
+                # 応答待ちのモデルがなくなったら次のモデルに送る
+                if winner is None and not attempts:
+                    launch()
+        finally:
+            # 負けた（または呼び出し側が中断した）リクエストを取り消す
+            now = time.monotonic()
+            for task, (route, generator, sent_at) in attempts.items():
+                if winner is not None:
+                    # ヘッジで負けたモデルは、ここまでの経過時間を応答開始までの時間の下限として別に記録する
+                    # （実測には混ぜない。直前に送ったヘッジの短い経過時間で速く見えてしまうため）
+                    route.lower_bounds.append((now, now - sent_at))
+                task.cancel()
+                route.cancelled += 1
+                route.breaker.release()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+                for route, generator, _ in attempts.values():
+                    await generator.aclose()
+
+        if winner is None:
+            if errors:
+                model, error = errors[0]
+                raise Exception(f'ChatGPT API呼び出しに失敗しました ({model}): {error}')
+            raise Exception('ChatGPT API呼び出しに失敗しました: 利用できるモデルがありません（一時停止中）')
+
+        route, generator, first = winner
+        completed = False
+        try:
+            if first:
+                yield first
+            async for delta in generator:
+                yield delta
+            completed = True
+        except Exception as e:
+            self._record_error(route, e)
+            raise
+        finally:
+            await generator.aclose()
+            if completed:
+                route.breaker.record_success()
+            else:
+                route.breaker.release()
+
+    def _record_error(self, route, error):
+        """エラーを記録（モデル側の障害のときだけサーキットブレーカーの失敗として数える）"""
+        route.failures += 1
+        if is_outage(error):
+            route.breaker.record_failure(time.monotonic())
+        else:
+            # リクエスト側の誤り（4xx）はモデルの状態とは関係ないので、試行中の枠だけ返す
+            route.breaker.release()
+
+    def stats(self):
+        """モデルごとの状態・リクエスト数・失敗数・応答開始までの時間（p50/p95）"""
+        now = time.monotonic()
+        stats = {}
+        for route in self.routes:
+            route.breaker.available(now)  # open の期限切れを half-open に更新
+            latencies = route.recent_latencies(now)
+            stats[route.model] = {
+                'state': route.breaker.state,
+                'requests': route.requests,
+                'failures': route.failures,
+                'hedges': route.hedges,
+                'cancelled': route.cancelled,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+            }
+        return stats
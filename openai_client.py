@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル共通のOpenAIクライアント
+
+OpenAI(...) を呼び出しのたびに作成し、同期クライアントで呼び出すと、
+モデルの応答を待つ間イベントループ全体が止まる（長い文字起こし中は他のイベントも処理されない）。
+AsyncOpenAI を1つだけ作成して使い回し、HTTP接続をキープアライブで再利用する。
+処理の種類ごとに同時実行数とタイムアウトを制限し、長い処理が他の処理の枠を使い切らないようにする。
+
+使い方:
+    from openai_client import OpenAIClient
+
+    openai_client = OpenAIClient(OPENAI_API_KEY)
+
+    async with openai_client.slot('chat') as client:
+        response = await client.chat.completions.create(...)
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+from openai import AsyncOpenAI
+
+# HTTP接続プール（キープアライブで接続を使い回す）
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10
+OPENAI_KEEPALIVE_EXPIRY = 60.0  # 秒
+OPENAI_CONNECT_TIMEOUT = 10.0  # 秒
+OPENAI_MAX_RETRIES = 2  # 接続エラー・429・5xx の再試行回数（SDKが待機時間を延ばしながら再試行）
+
+# 処理の種類ごとの (同時実行数, タイムアウト秒)
+OPENAI_SLOTS = {
+    'chat': (8, 60.0),  # テキスト応答・議事録生成
+    'image': (4, 90.0),  # 画像の読み取り
+    'audio': (2, 300.0),  # 音声の文字起こし（長い音声は数分かかる）
+    'embedding': (8, 30.0),  # 埋め込み（応答キャッシュの類似検索）
+}
+
+
+class OpenAIClient:
+    """共有の AsyncOpenAI クライアント（処理の種類ごとに同時実行数とタイムアウトを制限）"""
+
+    def __init__(self, api_key, slots=OPENAI_SLOTS):
+        self.api_key = api_key
+        self._client = None
+        self._slots = {
+            kind: (asyncio.Semaphore(concurrency), timeout)
+            for kind, (concurrency, timeout) in slots.items()
+        }
+
+        # 統計情報
+        self.in_flight = dict.fromkeys(slots, 0)
+        self.waiting = dict.fromkeys(slots, 0)  # 同時実行数の上限で待っている数
+        self.requests = dict.fromkeys(slots, 0)
+        self.errors = dict.fromkeys(slots, 0)
+
+    @property
+    def client(self):
+        """AsyncOpenAI クライアント（最初に使われたときに作成）"""
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(OPENAI_SLOTS['chat'][1], connect=OPENAI_CONNECT_TIMEOUT),
+                ),
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def slot(self, kind='chat'):
+        """同時実行数の枠を確保し、その種類のタイムアウトを設定したクライアントを返す"""
+        semaphore, timeout = self._slots[kind]
+        self.waiting[kind] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[kind] -= 1
+
+        self.in_flight[kind] += 1
+        self.requests[kind] += 1
+        try:
+            yield self.client.with_options(timeout=timeout)
+        except Exception:
+            self.errors[kind] += 1
+            raise
+        finally:
+            self.in_flight[kind] -= 1
+            semaphore.release()
+
+    async def close(self):
+        """HTTP接続を閉じる（終了時）"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self):
+        """処理の種類ごとの実行中・待機中・累計リクエスト数・エラー数"""
+        return {
+            kind: {
+                'in_flight': self.in_flight[kind],
+                'waiting': self.waiting[kind],
+                'requests': self.requests[kind],
+                'errors': self.errors[kind],
+            }
+            for kind in self._slots
+        }
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル共通のChatGPT応答キャッシュ
+
+同じ質問が何度も届く場合に、前回の応答を返してAPI呼び出しを省く。
+質問を正規化（全角・半角、大文字・小文字、空白、末尾の記号をそろえる）したハッシュで完全一致を探し、
+見つからなければ埋め込みベクトルのコサイン類似度で言い回しの違う同じ質問を探す（類似検索は省略可能）。
+キャッシュはTTL付きのLRUで、件数の上限を超えたら最も長く使われていないものから破棄する。
+
+使い方:
+    from response_cache import ResponseCache
+
+    response_cache = ResponseCache(openai_client)  # openai_client=None なら完全一致のみ
+
+    response = await response_cache.get(question)  # 見つからない場合は None
+    if response is None:
+        response = ...  # API呼び出し
+        await response_cache.put(question, response)
+"""
+import hashlib
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from operator import mul
+
+# 類似検索に使う埋め込みモデルと次元数（次元を減らして類似度の計算を軽くする）
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_DIMENSIONS = 256
+
+# この類似度以上なら同じ質問とみなす（高すぎると言い回しの違いを拾えず、低すぎると別の質問に同じ応答を返す）
+SIMILARITY_THRESHOLD = 0.93
+
+# 直近に計算した埋め込みを保持する数（get で計算した埋め込みを put で使い回す）
+EMBEDDING_MEMO_SIZE = 256
+
+# 正規化で取り除く末尾の記号
+TRAILING_PUNCTUATION = re.compile(r'[\s?？!！。.、,]+$')
+
+
+def normalize(text):
+    """質問を正規化（全角・半角、大文字・小文字、空白、末尾の記号をそろえる）"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = ' '.join(text.split())
+    return TRAILING_PUNCTUATION.sub('', text)
+
+
+class ResponseCache:
+    """質問 → 応答のキャッシュ（完全一致 + 埋め込みの類似検索、TTL + LRU）"""
+
+    def __init__(self, openai_client=None, max_size=1000, ttl=24 * 60 * 60, threshold=SIMILARITY_THRESHOLD):
+        self.openai_client = openai_client  # None なら類似検索をしない
+        self.max_size = max_size
+        self.ttl = ttl  # 応答を保持する秒数
+        self.threshold = threshold
+        self._cache = OrderedDict()  # 質問のハッシュ -> (有効期限, 応答, 埋め込み)
+        self._embeddings = OrderedDict()  # 質問のハッシュ -> 埋め込み（直近に計算したもの）
+
+        # 統計情報
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.embedding_errors = 0
+        self.expired = 0
+        self.evicted = 0
+
+    async def get(self, question):
+        """キャッシュされた応答を取得（見つからない場合は None）"""
+        key = self._key(question)
+        now = time.monotonic()
+
+        cached = self._cache.get(key)
+        if cached:
+            expires_at, response, _ = cached
+            if expires_at > now:
+                self._cache.move_to_end(key)
+                self.exact_hits += 1
+                return response
+            del self._cache[key]
+            self.expired += 1
+
+        if self.openai_client:
+            embedding = await self._embed(key, question)
+            match = self._most_similar(embedding, now) if embedding else None
+            if match:
+                self._cache.move_to_end(match)
+                self.semantic_hits += 1
+                return self._cache[match][1]
+
+        self.misses += 1
+        return None
+
+    async def put(self, question, response):
+        """応答をキャッシュに保存"""
+        key = self._key(question)
+        embedding = await self._embed(key, question) if self.openai_client else None
+        self._cache[key] = (time.monotonic() + self.ttl, response, embedding)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+            self.evicted += 1
+
+    def clear(self):
+        """キャッシュを空にする（プロンプトを変更したときなど）"""
+        self._cache.clear()
+        self._embeddings.clear()
+
+    def _key(self, question):
+        """正規化した質問のハッシュ"""
+        return hashlib.sha256(normalize(question).encode('utf-8')).hexdigest()
+
+    async def _embed(self, key, question):
+        """質問の埋め込み（長さ1に正規化済み）。取得できない場合は None"""
+        embedding = self._embeddings.get(key)
+        if embedding:
+            self._embeddings.move_to_end(key)
+            return embedding
+
+        try:
+            async with self.openai_client.slot('embedding') as client:
+                response = await client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=normalize(question),
+                    dimensions=EMBEDDING_DIMENSIONS,
+                )
+        except Exception as e:
+            self.embedding_errors += 1
+            print(f'埋め込みの取得エラー: {e}')
+            return None
+
+        vector = response.data[0].embedding
+        norm = math.sqrt(sum(map(mul, vector, vector))) or 1.0
+        embedding = tuple(value / norm for value in vector)
+
+        self._embeddings[key] = embedding
+        while len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+            self._embeddings.popitem(last=False)
+        return embedding
+
+    def _most_similar(self, embedding, now):
+        """類似度が閾値以上で最も近い質問のハッシュ（なければ None）"""
+        best_key = None
+        best_score = self.threshold
+        for key, (expires_at, _, cached_embedding) in self._cache.items():
+            if cached_embedding is None or expires_at <= now:
+                continue
+            score = sum(map(mul, embedding, cached_embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def stats(self):
+        """ヒット/ミスの統計情報を取得"""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            'lookups': lookups,
+            'exact_hits': self.exact_hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'cached': len(self._cache),
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'embedding_errors': self.embedding_errors,
+        }
@@ -2,8 +2,11 @@ import discord
 from discord.ext import commands
 import os
 import asyncio
+import gzip
+import json
 from datetime import datetime
 from dotenv import load_dotenv
+from split_upload import SplitUploader
 
 load_dotenv()
 
@@ -15,9 +18,124 @@ intents.reactions = True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# アーカイブモード（True の場合、👍で前回の続きから差分だけを取得してアーカイブに追記する）
+ARCHIVE_MODE = False
+ARCHIVE_DIR = 'archive'
+ARCHIVE_CHECKPOINT_INTERVAL = 500  # この件数ごとにアーカイブへ書き込み、チェックポイントを保存
+
+# チャンネルごとのアーカイブ処理のロック（同じチャンネルへの同時実行を防ぐ）
+archive_locks = {}
+
+def get_archive_paths(channel_id):
+    """アーカイブファイルとチェックポイントファイルのパス"""
+    return (
+        os.path.join(ARCHIVE_DIR, f'{channel_id}.jsonl.gz'),
+        os.path.join(ARCHIVE_DIR, f'{channel_id}.checkpoint.json')
+    )
+
+def load_checkpoint(channel_id):
+    """チェックポイント（最後にアーカイブしたメッセージID、その時点のアーカイブサイズ、累計件数）を読み込む"""
+    _, checkpoint_path = get_archive_paths(channel_id)
+    if not os.path.exists(checkpoint_path):
+        return {'last_message_id': 0, 'archive_size': 0, 'message_count': 0}
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_checkpoint(channel_id, checkpoint):
+    """チェックポイントを保存（一時ファイルに書いてから置き換えるので、途中で落ちても壊れない）"""
+    _, checkpoint_path = get_archive_paths(channel_id)
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+def append_archive(channel_id, checkpoint, lines, last_message_id):
+    """メッセージをアーカイブに追記してチェックポイントを進める
+    
+    追記分は独立したgzipメンバーとして書き込む（連結したgzipはそのまま1つのファイルとして読める）。
+    """
+    archive_path, _ = get_archive_paths(channel_id)
+    with open(archive_path, 'ab') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            gz.write(''.join(lines).encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+        archive_size = f.tell()
+    
+    checkpoint['last_message_id'] = last_message_id
+    checkpoint['archive_size'] = archive_size
+    checkpoint['message_count'] += len(lines)
+    save_checkpoint(channel_id, checkpoint)
+
+async def archive_channel(channel):
+    """前回のチェックポイント以降のメッセージだけを取得してアーカイブに追記
+    
+    戻り値は (今回追加した件数, チェックポイント)。
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archive_path, _ = get_archive_paths(channel.id)
+    checkpoint = load_checkpoint(channel.id)
+    
+    # 前回チェックポイントを保存する前に中断していた場合、記録されていない末尾を切り捨てる
+    if os.path.exists(archive_path) and os.path.getsize(archive_path) > checkpoint['archive_size']:
+        with open(archive_path, 'r+b') as f:
+            f.truncate(checkpoint['archive_size'])
+    
+    after = discord.Object(id=checkpoint['last_message_id']) if checkpoint['last_message_id'] else None
+    new_count = 0
+    lines = []
+    last_message_id = checkpoint['last_message_id']
+    
+    async for message in channel.history(limit=None, after=after, oldest_first=True):
+        lines.append(json.dumps({
+            'id': message.id,
+            'timestamp': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'author': str(message.author),
+            'content': message.content
+        }, ensure_ascii=False) + '\n')
+        last_message_id = message.id
+        
+        if len(lines) >= ARCHIVE_CHECKPOINT_INTERVAL:
+            append_archive(channel.id, checkpoint, lines, last_message_id)
+            new_count += len(lines)
+            lines = []
+            print(f'{channel.name}: {new_count}件アーカイブ済み')
+    
+    if lines:
+        append_archive(channel.id, checkpoint, lines, last_message_id)
+        new_count += len(lines)
+    
+    return new_count, checkpoint
+
+async def handle_archive(channel):
+    """👍リアクションによる差分アーカイブ処理（アーカイブモード）"""
+    lock = archive_locks.setdefault(channel.id, asyncio.Lock())
+    if lock.locked():
+        await channel.send('このチャンネルのアーカイブは実行中です。')
+        return
+    
+    async with lock:
+        await channel.send('アーカイブの更新を開始します...')
+        try:
+            new_count, checkpoint = await archive_channel(channel)
+            archive_path, _ = get_archive_paths(channel.id)
+            await channel.send(
+                f'アーカイブを更新しました！\n'
+                f'今回の追加: {new_count}件\n'
+                f'累計: {checkpoint["message_count"]}件\n'
+                f'アーカイブサイズ: {checkpoint["archive_size"]:,}バイト ({archive_path})'
+            )
+        except Exception as e:
+            # 途中までの内容はチェックポイントに記録済みなので、次回の👍で続きから再開する
+            await channel.send(f'アーカイブ中にエラーが発生しました（次回は続きから再開します）: {str(e)}')
+
 @bot.event
 async def on_ready():
     print(f'{bot.user}としてログインしました！')
+    if ARCHIVE_MODE:
+        print(f'アーカイブモード: 👍で差分を {ARCHIVE_DIR}/ に追記します')
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -30,63 +148,41 @@ async def on_raw_reaction_add(payload):
         if not channel:
             return
         
+        if ARCHIVE_MODE:
+            await handle_archive(channel)
+            return
+        
         await channel.send('投稿一覧の取得を開始します...')
         
         try:
-            # メッセージ履歴を100件ずつ取得
-            messages = []
-            last_message = None
-            batch_count = 0
-            
-            for batch in range(20):  # 最大20回（20 × 100 = 2000件）
-                # 100件ずつ取得
-                batch_messages = []
-                async for message in channel.history(limit=100, before=last_message):
-                    batch_messages.append({
-                        'timestamp': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                        'author': str(message.author),
-                        'content': message.content,
-                        'id': message.id
-                    })
-                    last_message = message
-                
-                # バッチが空の場合は終了
-                if not batch_messages:
-                    break
-                
-                messages.extend(batch_messages)
-                batch_count += 1
-                print(f'{batch_count * 100}件取得完了（実際: {len(messages)}件）')
-                
-                # 2秒間スリープ
-                await asyncio.sleep(2)
-            
-            # テキストファイルを作成
             filename = f'channel_messages_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-            filepath = f'/tmp/{filename}'
+            uploader = SplitUploader(channel, filename)
+            message_count = 0
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f'チャンネル: {channel.name}\n')
-                f.write(f'取得日時: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
-                f.write(f'取得件数: {len(messages)}件\n')
-                f.write('=' * 50 + '\n\n')
-                
-                # メッセージを新しい順に並び替え（最新が上に）
-                for msg in reversed(messages):
-                    f.write(f'[{msg["timestamp"]}] {msg["author"]}\n')
-                    f.write(f'{msg["content"]}\n')
-                    f.write('-' * 30 + '\n')
+            # メッセージ履歴を古い順に取得しながら、1件ずつ書き出す
+            # （全件をメモリに溜めないので、チャンネルの大きさによらずメモリ使用量は一定。
+            #   アップロード上限を超えた分はgzip圧縮・分割して1パートずつ送信する）
+            # レート制限は discord.py がレスポンスヘッダー（X-RateLimit-*）を見て自動で待機するため、固定のsleepは入れない
+            uploader.write(f'チャンネル: {channel.name}\n')
+            uploader.write(f'取得日時: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
+            uploader.write('=' * 50 + '\n\n')
             
-            # ファイルをDiscordにアップロード
-            with open(filepath, 'rb') as f:
-                discord_file = discord.File(f, filename)
-                await channel.send(
-                    f'投稿一覧の取得が完了しました！\n取得件数: {len(messages)}件',
-                    file=discord_file
+            async for message in channel.history(limit=None, oldest_first=True):
+                uploader.write(
+                    f'[{message.created_at.strftime("%Y-%m-%d %H:%M:%S")}] {message.author}\n'
+                    f'{message.content}\n'
+                    + '-' * 30 + '\n'
                 )
+                await uploader.upload_ready()
+                message_count += 1
+                
+                if message_count % 1000 == 0:
+                    print(f'{message_count}件取得完了')
+            
+            uploader.write(f'\n取得件数: {message_count}件\n')
             
-            # 一時ファイルを削除
-            os.remove(filepath)
+            # 残りをDiscordにアップロード
+            await uploader.close(f'投稿一覧の取得が完了しました！\n取得件数: {message_count}件')
             
         except Exception as e:
             await channel.send(f'エラーが発生しました: {str(e)}')
@@ -1,46 +1,654 @@
 import discord
+from discord import app_commands
 from discord.ext import commands
 import os
-from datetime import datetime
+import asyncio
+import bisect
+import itertools
+import shutil
+import threading
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from split_upload import SplitUploader
 
 load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
-TARGET_CHANNEL_ID = 1394203406574424104  # ログを記録する対象チャンネル
+# ログを記録する対象チャンネル（複数指定可）
+TARGET_CHANNEL_IDS = {
+    1394203406574424104,
+}
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# ログの保存先（チャンネルごとのディレクトリに、日付・サイズごとのセグメントファイルに分けて保存）
+LOG_DIR = 'room_logs'
+LOG_MAX_OPEN_FILES = 64  # 同時に開いておくログファイルの上限（超えたら最も使われていないものを閉じる）
+LOG_SEGMENT_MAX_SIZE = 10 * 1024 * 1024  # 10MB を超えたら次のセグメントへ
+LOG_RETENTION_DAYS = None  # 日数を指定すると、それより古いセグメントを削除（None は削除しない）
 
-# ログファイルのパス
-LOG_FILE_PATH = 'room_log.txt'
+# 以前のバージョンのログ（1チャンネルのみ記録していた頃のもの）と、その記録対象チャンネル
+# 見つかった場合は、このチャンネルのログとして取り込む
+LEGACY_LOG_FILE_PATH = 'room_log.txt'
+LEGACY_CHANNEL_ID = 1394203406574424104
+
+# セグメントファイル名（room_log_YYYYMMDD_NNN.txt）
+LOG_SEGMENT_PATTERN = re.compile(r'^room_log_(\d{8})_(\d{3})\.txt$')
+
+# 各セグメントのインデックス（行数・タイムスタンプ・一定行数ごとのバイト位置）
+LOG_INDEX_INTERVAL = 1000  # この行数ごとにバイト位置を記録
+
+# ログ1件の先頭行（[YYYY-MM-DD HH:MM:SS] 投稿者: 内容）
+LOG_LINE_PATTERN = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] ')
+
+# ログ書き込みのバッファ設定（どちらかに達したらまとめてファイルに書き込む）
+LOG_FLUSH_INTERVAL = 1.0  # 秒
+LOG_FLUSH_LINES = 100  # 行
+
+# 全文検索用のデータベース（SQLite FTS5、メッセージIDをキーに保存）
+SEARCH_DB_PATH = os.path.join(LOG_DIR, 'search.db')
+SEARCH_RESULT_LIMIT = 10  # /search で表示する件数
+SEARCH_MIN_TERM_LENGTH = 3  # trigram トークナイザーの索引で検索できる最短の語の長さ
+SEARCH_SCAN_LIMIT = 50000  # 索引を使えない短い語だけの検索で走査する件数（新しい順）
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    guild_id INTEGER,
+    channel_id INTEGER NOT NULL,
+    author TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='message_id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.message_id, new.content);
+END;
+"""
+
+class LogIndex:
+    """ログファイルのサイドカーインデックス
+    
+    行数・サイズ・最初/最後のタイムスタンプと、LOG_INDEX_INTERVAL 行ごとの
+    (行番号, バイト位置, タイムスタンプ) を追記のたびに更新する。
+    状態確認はファイルを読まずに済み、時間範囲の切り出しは該当箇所だけを読めばよい。
+    """
+    
+    def __init__(self, log_path, interval=LOG_INDEX_INTERVAL):
+        self.log_path = log_path
+        self.index_path = log_path + '.index.json'
+        self.interval = interval
+        self.reset()
+    
+    def reset(self):
+        self.line_count = 0
+        self.size = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.checkpoints = []  # [行番号, バイト位置, タイムスタンプ]
+    
+    def load(self):
+        """インデックスを読み込む（ログファイルと合わない場合は作り直す）"""
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('size') == log_size:
+                self.line_count = data['line_count']
+                self.size = data['size']
+                self.first_timestamp = data['first_timestamp']
+                self.last_timestamp = data['last_timestamp']
+                self.checkpoints = data['checkpoints']
+                return
+        
+        self.rebuild()
+    
+    def rebuild(self):
+        """ログファイルを1回だけ走査してインデックスを作り直す"""
+        self.reset()
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    self.add(line, self.parse_timestamp(line.decode('utf-8', errors='replace')))
+        self.save()
+        print(f'ログのインデックスを作成しました: {os.path.basename(self.log_path)} ({self.line_count}行)')
+    
+    def overlaps(self, start, end):
+        """このセグメントに start〜end のログが含まれる可能性があるか"""
+        if not self.first_timestamp:
+            return False
+        return self.first_timestamp <= end and self.last_timestamp >= start
+    
+    @staticmethod
+    def parse_timestamp(line):
+        """ログ1件の先頭行ならタイムスタンプを返す"""
+        match = LOG_LINE_PATTERN.match(line)
+        return match.group(1) if match else None
+    
+    def add(self, data, timestamp):
+        """追記したログ1件（複数行の場合あり）をインデックスに反映"""
+        if self.line_count // self.interval >= len(self.checkpoints):
+            self.checkpoints.append([self.line_count, self.size, timestamp or self.last_timestamp or ''])
+        
+        self.line_count += data.count(b'\n')
+        self.size += len(data)
+        if timestamp:
+            self.first_timestamp = self.first_timestamp or timestamp
+            self.last_timestamp = timestamp
+    
+    def save(self):
+        """インデックスを保存（一時ファイルに書いてから置き換える）"""
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'line_count': self.line_count,
+                'size': self.size,
+                'first_timestamp': self.first_timestamp,
+                'last_timestamp': self.last_timestamp,
+                'checkpoints': self.checkpoints
+            }, f)
+        os.replace(tmp_path, self.index_path)
+    
+    def iter_range(self, start, end):
+        """タイムスタンプが start〜end（'YYYY-MM-DD HH:MM:SS'）のログ行を返す
+        
+        インデックスから読み始め・読み終わりのバイト位置を決めるので、
+        範囲外の大部分は読まない（前後の最大 LOG_INDEX_INTERVAL 行だけ余分に読む）。
+        """
+        timestamps = [checkpoint[2] for checkpoint in self.checkpoints]
+        start_index = max(bisect.bisect_left(timestamps, start) - 1, 0)
+        end_index = bisect.bisect_right(timestamps, end)
+        start_offset = self.checkpoints[start_index][1] if self.checkpoints else 0
+        end_offset = self.checkpoints[end_index][1] if end_index < len(self.checkpoints) else self.size
+        
+        current_timestamp = None
+        with open(self.log_path, 'rb') as f:
+            f.seek(start_offset)
+            while f.tell() < end_offset:
+                line = f.readline()
+                if not line:
+                    break
+                text = line.decode('utf-8', errors='replace')
+                # 複数行のメッセージの2行目以降は、直前の先頭行のタイムスタンプに属する
+                current_timestamp = self.parse_timestamp(text) or current_timestamp
+                if current_timestamp and start <= current_timestamp <= end:
+                    yield text
+
+class SegmentedLog:
+    """日付・サイズごとのセグメントファイルに分けたログ
+    
+    各セグメントは LogIndex を持つので、時間範囲の書き出しは
+    該当するセグメントの該当箇所だけを読めばよい。
+    """
+    
+    def __init__(self, log_dir, max_size=LOG_SEGMENT_MAX_SIZE, retention_days=LOG_RETENTION_DAYS):
+        self.log_dir = log_dir
+        self.max_size = max_size
+        self.retention_days = retention_days
+        self.segments = []  # 古い順の LogIndex
+        self.file = None  # 現在のセグメントのファイル（開いたままにする）
+    
+    def load(self):
+        """セグメント一覧とインデックスを読み込む"""
+        os.makedirs(self.log_dir, exist_ok=True)
+        
+        self.segments = []
+        for filename in sorted(os.listdir(self.log_dir)):
+            if LOG_SEGMENT_PATTERN.match(filename):
+                segment = LogIndex(os.path.join(self.log_dir, filename))
+                segment.load()
+                self.segments.append(segment)
+    
+    @property
+    def current(self):
+        return self.segments[-1] if self.segments else None
+    
+    @staticmethod
+    def segment_date(segment):
+        return LOG_SEGMENT_PATTERN.match(os.path.basename(segment.log_path)).group(1)
+    
+    def _segment_for(self, timestamp):
+        """書き込み先のセグメント（日付が変わった・サイズ上限を超えた場合は新しいセグメント）"""
+        current = self.current
+        date = timestamp[:10].replace('-', '') if timestamp else None
+        
+        if current and current.size < self.max_size and (date is None or date == self.segment_date(current)):
+            return current
+        # ログのタイムスタンプ（message.created_at）はUTCなので、日付もUTCで揃える
+        return self._rotate(date or datetime.now(timezone.utc).strftime('%Y%m%d'))
+    
+    def _rotate(self, date):
+        """新しいセグメントを作成"""
+        self.close()
+        sequence = sum(1 for segment in self.segments if self.segment_date(segment) == date) + 1
+        segment = LogIndex(os.path.join(self.log_dir, f'room_log_{date}_{sequence:03d}.txt'))
+        self.segments.append(segment)
+        print(f'ログセグメントを作成しました: {os.path.basename(segment.log_path)}')
+        self._apply_retention()
+        return segment
+    
+    def _apply_retention(self):
+        """保持期間を過ぎたセグメントを削除（現在のセグメントは残す）"""
+        if not self.retention_days:
+            return
+        
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        for segment in self.segments[:-1]:
+            if segment.last_timestamp and segment.last_timestamp < cutoff:
+                os.remove(segment.log_path)
+                if os.path.exists(segment.index_path):
+                    os.remove(segment.index_path)
+                self.segments.remove(segment)
+                print(f'保持期間を過ぎたログセグメントを削除しました: {os.path.basename(segment.log_path)}')
+    
+    def append(self, lines):
+        """(行, タイムスタンプ) のリストを追記し、インデックスを更新する"""
+        chunks = []
+        segment = None
+        for line, timestamp in lines:
+            target = self._segment_for(timestamp)
+            if target is not segment and chunks:
+                self._write(segment, chunks)
+                chunks = []
+            segment = target
+            data = line.encode('utf-8')
+            segment.add(data, timestamp)
+            chunks.append(data)
+        if chunks:
+            self._write(segment, chunks)
+    
+    def _write(self, segment, chunks):
+        if self.file is None or self.file.name != segment.log_path:
+            self.close()
+            self.file = open(segment.log_path, 'ab')
+        self.file.write(b''.join(chunks))
+        self.file.flush()
+        segment.save()
+    
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    def segments_in_range(self, start, end):
+        """start〜end のログを含むセグメント"""
+        return [segment for segment in self.segments if segment.overlaps(start, end)]
+    
+    @property
+    def size(self):
+        return sum(segment.size for segment in self.segments)
+    
+    @property
+    def line_count(self):
+        return sum(segment.line_count for segment in self.segments)
+    
+    @property
+    def first_timestamp(self):
+        return next((segment.first_timestamp for segment in self.segments if segment.first_timestamp), None)
+    
+    @property
+    def last_timestamp(self):
+        return next((segment.last_timestamp for segment in reversed(self.segments) if segment.last_timestamp), None)
+
+class ChannelLogs:
+    """チャンネルごとのログ（SegmentedLog）を管理するクラス
+    
+    ログは最初に使われたときに読み込む。開いたままのファイルは LOG_MAX_OPEN_FILES 個までとし、
+    超えた場合は最も長く使われていないチャンネルのファイルを閉じる（LRU）。
+    書き込みスレッドとコマンドの両方から使うのでロックで保護する。
+    """
+    
+    def __init__(self, log_dir, max_open_files=LOG_MAX_OPEN_FILES):
+        self.log_dir = log_dir
+        self.max_open_files = max_open_files
+        self.logs = {}  # チャンネルID -> SegmentedLog
+        self.open_files = OrderedDict()  # ファイルを開いているチャンネルID（古い順）
+        self.lock = threading.Lock()
+    
+    def migrate_legacy_logs(self):
+        """1チャンネルのみ記録していた頃のログを LEGACY_CHANNEL_ID のディレクトリに移動
+        
+        移動前にそのチャンネルのログを読み込む（新しいログを作る）と古いログを取り込めないので、
+        Botの起動前（メッセージの記録を始める前）に呼ぶ。
+        """
+        channel_dir = os.path.join(self.log_dir, str(LEGACY_CHANNEL_ID))
+        with self.lock:
+            if LEGACY_CHANNEL_ID in self.logs:
+                raise RuntimeError('ログの読み込み後に以前のログを移動することはできません')
+            os.makedirs(channel_dir, exist_ok=True)
+            
+            # room_log.txt（単一ファイル時代）
+            if os.path.exists(LEGACY_LOG_FILE_PATH):
+                os.replace(LEGACY_LOG_FILE_PATH, os.path.join(channel_dir, 'room_log_00000000_000.txt'))
+                if os.path.exists(LEGACY_LOG_FILE_PATH + '.index.json'):
+                    os.remove(LEGACY_LOG_FILE_PATH + '.index.json')
+            
+            # room_logs/ 直下のセグメント（チャンネル別ディレクトリ導入前）
+            for filename in os.listdir(self.log_dir):
+                if LOG_SEGMENT_PATTERN.match(filename.removesuffix('.index.json')):
+                    shutil.move(os.path.join(self.log_dir, filename), os.path.join(channel_dir, filename))
+    
+    def get(self, channel_id):
+        """チャンネルのログを取得（未読み込みなら読み込む）"""
+        with self.lock:
+            log = self.logs.get(channel_id)
+            if log is None:
+                log = SegmentedLog(os.path.join(self.log_dir, str(channel_id)))
+                log.load()
+                if log.size == 0:
+                    log.append([(f'=== ルームログ開始: {datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")} ===\n', None)])
+                    self._touch(channel_id)
+                self.logs[channel_id] = log
+            return log
+    
+    def append(self, channel_id, lines):
+        """チャンネルのログに追記（スレッド内で実行）"""
+        log = self.get(channel_id)
+        with self.lock:
+            log.append(lines)
+            self._touch(channel_id)
+    
+    def _touch(self, channel_id):
+        """ファイルを開いたチャンネルとして記録し、上限を超えたら古いものを閉じる"""
+        self.open_files[channel_id] = True
+        self.open_files.move_to_end(channel_id)
+        while len(self.open_files) > self.max_open_files:
+            old_channel_id, _ = self.open_files.popitem(last=False)
+            self.logs[old_channel_id].close()
+    
+    def close(self):
+        with self.lock:
+            for log in self.logs.values():
+                log.close()
+            self.open_files.clear()
+
+class MessageSearchStore:
+    """記録したメッセージの全文検索用ストア（SQLite FTS5）
+    
+    本文を trigram トークナイザーで索引するので、分かち書きのない日本語も部分一致で検索できる。
+    メッセージIDを主キーにしているため、同じメッセージを2回追加しても1件になる。
+    データベースは最初に使われたときに開く。書き込みスレッドとコマンドの両方から使うのでロックで保護する。
+    """
+    
+    def __init__(self, db_path=SEARCH_DB_PATH):
+        self.db_path = db_path
+        self.connection = None
+        self.lock = threading.Lock()
+    
+    def _connect(self):
+        """データベースを開き、テーブルがなければ作成"""
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SEARCH_SCHEMA)
+            self.connection = connection
+        return self.connection
+    
+    def add_messages(self, records):
+        """メッセージをまとめて追加（スレッド内で実行）
+        
+        records は (メッセージID, ギルドID, チャンネルID, 投稿者, 投稿日時, 本文) のリスト。
+        戻り値は新しく追加した件数。
+        """
+        with self.lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.executemany(
+                    'INSERT OR IGNORE INTO messages (message_id, guild_id, channel_id, author, created_at, content) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    records
+                )
+            return cursor.rowcount
+    
+    @staticmethod
+    def split_query(query):
+        """検索語を索引で検索できる語と、短すぎて索引を使えない語に分ける"""
+        terms = query.split()
+        long_terms = [term for term in terms if len(term) >= SEARCH_MIN_TERM_LENGTH]
+        short_terms = [term for term in terms if len(term) < SEARCH_MIN_TERM_LENGTH]
+        return long_terms, short_terms
+    
+    def search(self, query, channel_ids, limit=SEARCH_RESULT_LIMIT):
+        """本文に検索語をすべて含むメッセージを検索（スレッド内で実行）
+        
+        3文字以上の語は索引で絞り込み、新しい順に返す（索引をメッセージIDの降順に読み、
+        limit 件見つかった時点で打ち切るので、ヒット件数が多くても速い）。
+        2文字以下の語しかない場合は索引を使えないので、直近 SEARCH_SCAN_LIMIT 件の本文を走査する。
+        戻り値は (メッセージID, ギルドID, チャンネルID, 投稿者, 投稿日時, 抜粋) のリスト。
+        """
+        long_terms, short_terms = self.split_query(query)
+        if not channel_ids or not (long_terms or short_terms):
+            return []
+        
+        channel_placeholders = ', '.join('?' * len(channel_ids))
+        like_conditions = ["m.content LIKE ? ESCAPE '\\'" for _ in short_terms]
+        like_params = [
+            '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            for term in short_terms
+        ]
+        
+        if long_terms:
+            # 各語をフレーズとして扱い、FTS5の演算子として解釈されないようにする
+            match = ' '.join('"' + term.replace('"', '""') + '"' for term in long_terms)
+            sql = (
+                'SELECT m.message_id, m.guild_id, m.channel_id, m.author, m.created_at, '
+                "snippet(messages_fts, 0, '**', '**', '…', 16) "
+                'FROM messages_fts JOIN messages m ON m.message_id = messages_fts.rowid '
+                'WHERE ' + ' AND '.join(['messages_fts MATCH ?', f'm.channel_id IN ({channel_placeholders})', *like_conditions]) + ' '
+                'ORDER BY messages_fts.rowid DESC LIMIT ?'
+            )
+            params = [match, *channel_ids, *like_params, limit]
+        else:
+            # 直近 SEARCH_SCAN_LIMIT 件より新しいメッセージだけを、主キーの降順に走査する
+            sql = (
+                'SELECT m.message_id, m.guild_id, m.channel_id, m.author, m.created_at, substr(m.content, 1, 100) '
+                'FROM messages m '
+                'WHERE ' + ' AND '.join([
+                    'm.message_id >= COALESCE((SELECT message_id FROM messages ORDER BY message_id DESC LIMIT 1 OFFSET ?), 0)',
+                    f'm.channel_id IN ({channel_placeholders})',
+                    *like_conditions
+                ]) + ' '
+                'ORDER BY m.message_id DESC LIMIT ?'
+            )
+            params = [SEARCH_SCAN_LIMIT, *channel_ids, *like_params, limit]
+        
+        with self.lock:
+            return self._connect().execute(sql, params).fetchall()
+    
+    def count(self):
+        """保存しているメッセージ数（スレッド内で実行）"""
+        with self.lock:
+            return self._connect().execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+class LogWriter:
+    """バックグラウンドでまとめてログを書き込むクラス
+    
+    on_message からはキューに入れるだけにして、ファイルへの書き込みは専用タスクが
+    一定時間・一定行数ごとにまとめてスレッドで行う（ファイルは開いたままにする）。
+    検索ストアが指定されている場合は、同じまとまりで検索用の索引にも追加する。
+    """
+    
+    def __init__(self, logs, search_store=None, flush_interval=LOG_FLUSH_INTERVAL, flush_lines=LOG_FLUSH_LINES):
+        self.logs = logs
+        self.search_store = search_store
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.queue = asyncio.Queue()
+        self.task = None
+        
+        # 統計情報
+        self.flush_count = 0
+        self.written_lines = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+    
+    def start(self):
+        """書き込みタスクを開始"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+    
+    def write(self, channel_id, line, timestamp=None, record=None):
+        """ログ1件をキューに追加（ブロックしない）。record は検索ストアに追加する内容"""
+        self.start()
+        self.queue.put_nowait((channel_id, line, timestamp, record))
+    
+    async def _run(self):
+        """キューから行を集めてまとめて書き込む"""
+        loop = asyncio.get_running_loop()
+        while True:
+            lines = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(lines) < self.flush_lines:
+                try:
+                    lines.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    lines.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            await self._flush_lines(lines)
+    
+    async def _flush_lines(self, lines):
+        """行をファイルに書き込み、キューの処理済みを通知"""
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write_lines, lines)
+        except Exception as e:
+            print(f'ログ書き込みエラー: {e}')
+        finally:
+            for _ in lines:
+                self.queue.task_done()
+        
+        self.last_flush_latency = time.perf_counter() - start
+        self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+        self.flush_count += 1
+        self.written_lines += len(lines)
+    
+    def _write_lines(self, lines):
+        """チャンネルごとにまとめてファイルに書き込み、インデックスを更新する（スレッド内で実行）"""
+        lines_by_channel = {}
+        records = []
+        for channel_id, line, timestamp, record in lines:
+            lines_by_channel.setdefault(channel_id, []).append((line, timestamp))
+            if record:
+                records.append(record)
+        
+        for channel_id, channel_lines in lines_by_channel.items():
+            self.logs.append(channel_id, channel_lines)
+        
+        # 検索用の索引に失敗してもログファイルへの記録は済んでいる
+        if self.search_store and records:
+            try:
+                self.search_store.add_messages(records)
+            except sqlite3.Error as e:
+                print(f'検索インデックス書き込みエラー: {e}')
+    
+    async def flush(self):
+        """キューにある行をすべて書き込むまで待つ"""
+        if self.task and not self.task.done():
+            await self.queue.join()
+    
+    async def close(self):
+        """残りを書き込んでファイルを閉じる（終了時）"""
+        await self.flush()
+        if self.task:
+            self.task.cancel()
+        
+        # 書き込みタスクが動いていなかった場合の残り
+        lines = []
+        while not self.queue.empty():
+            lines.append(self.queue.get_nowait())
+        if lines:
+            await self._flush_lines(lines)
+        
+        self.logs.close()
+        if self.search_store:
+            self.search_store.close()
+    
+    def stats(self):
+        """キューの深さと書き込み時間"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'flush_count': self.flush_count,
+            'written_lines': self.written_lines,
+            'last_flush_ms': self.last_flush_latency * 1000,
+            'max_flush_ms': self.max_flush_latency * 1000,
+            'open_files': len(self.logs.open_files),
+        }
+
+channel_logs = ChannelLogs(LOG_DIR)
+search_store = MessageSearchStore()
+log_writer = LogWriter(channel_logs, search_store)
+
+class LoggingBot(commands.Bot):
+    async def close(self):
+        # 終了時にバッファに残っているログを書き込む
+        await log_writer.close()
+        await super().close()
+
+bot = LoggingBot(command_prefix='!', intents=intents)
 
 def write_log(message_data):
-    """ログファイルにメッセージを記録"""
-    try:
-        with open(LOG_FILE_PATH, 'a', encoding='utf-8') as f:
-            f.write(f'[{message_data["timestamp"]}] {message_data["author"]}: {message_data["content"]}\n')
-    except Exception as e:
-        print(f'ログ書き込みエラー: {e}')
+    """ログファイルにメッセージを記録（バックグラウンドで書き込み）"""
+    log_writer.write(
+        message_data['channel_id'],
+        f'[{message_data["timestamp"]}] {message_data["author"]}: {message_data["content"]}\n',
+        message_data['timestamp'],
+        # 本文のあるメッセージは検索用の索引にも追加
+        (
+            message_data['id'],
+            message_data['guild_id'],
+            message_data['channel_id'],
+            message_data['author'],
+            message_data['timestamp'],
+            message_data['content']
+        ) if message_data['content'] else None
+    )
 
 @bot.event
 async def on_ready():
     print(f'{bot.user}としてログインしました！')
-    print(f'チャンネルID {TARGET_CHANNEL_ID} のログを記録開始します')
+    print(f'{len(TARGET_CHANNEL_IDS)}個のチャンネルのログを記録開始します')
     
-    # ログファイルの初期化（起動時のみ）
-    if not os.path.exists(LOG_FILE_PATH):
-        with open(LOG_FILE_PATH, 'w', encoding='utf-8') as f:
-            f.write(f'=== ルームログ開始: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")} ===\n')
+    # スラッシュコマンド（/search）を同期
+    try:
+        synced = await bot.tree.sync()
+        print(f'{len(synced)}個のスラッシュコマンドを同期しました')
+    except Exception as e:
+        print(f'スラッシュコマンドの同期に失敗しました: {e}')
 
 @bot.event
 async def on_message(message):
     # 対象チャンネルのメッセージのみ記録（Bot自身のメッセージも含む）
-    if message.channel.id == TARGET_CHANNEL_ID:
+    if message.channel.id in TARGET_CHANNEL_IDS:
         message_data = {
+            'guild_id': message.guild.id if message.guild else None,
+            'channel_id': message.channel.id,
             'timestamp': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'author': str(message.author),
             'content': message.content,
@@ -60,47 +668,44 @@ async def on_raw_reaction_add(payload):
         return
     
     # 対象チャンネルでのグッドマークリアクションのみ処理
-    if payload.channel_id == TARGET_CHANNEL_ID and str(payload.emoji) == '👍':
+    if payload.channel_id in TARGET_CHANNEL_IDS and str(payload.emoji) == '👍':
         channel = bot.get_channel(payload.channel_id)
         if not channel:
             return
         
         try:
-            # ログファイルが存在するかチェック
-            if not os.path.exists(LOG_FILE_PATH):
-                await channel.send('ログファイルが見つかりません。まだメッセージが記録されていないようです。')
-                return
+            # バッファに残っているログを書き込んでから送信する
+            await log_writer.flush()
             
-            # ログファイルのサイズをチェック
-            file_size = os.path.getsize(LOG_FILE_PATH)
+            # ログのサイズと行数をチェック（インデックスから取得）
+            room_log = await asyncio.to_thread(channel_logs.get, channel.id)
+            segments = list(room_log.segments)
+            file_size = sum(segment.size for segment in segments)
+            line_count = sum(segment.line_count for segment in segments)
             if file_size == 0:
                 await channel.send('ログファイルが空です。まだメッセージが記録されていないようです。')
                 return
             
-            # ファイルサイズが25MB以下かチェック（Discordの制限）
-            if file_size > 25 * 1024 * 1024:  # 25MB
-                await channel.send('ログファイルが大きすぎます（25MB以上）。ファイルを分割する必要があります。')
-                return
-            
-            # ログファイルをDiscordにアップロード
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+            # 全セグメントを順にDiscordにアップロード
+            # 上限を超える場合はgzip圧縮・分割しながら1パートずつ送信する
+            current_time = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
             filename = f'room_log_{current_time}.txt'
+            uploader = SplitUploader(channel, filename)
             
-            with open(LOG_FILE_PATH, 'rb') as f:
-                discord_file = discord.File(f, filename)
-                
-                # ファイル情報を取得
-                with open(LOG_FILE_PATH, 'r', encoding='utf-8') as log_f:
-                    lines = log_f.readlines()
-                    line_count = len(lines)
-                
-                await channel.send(
-                    f'ルームログをお送りします！\n'
-                    f'記録行数: {line_count}行\n'
-                    f'ファイルサイズ: {file_size:,}バイト',
-                    file=discord_file
-                )
-                print(f'ログファイルをアップロードしました: {filename}')
+            for segment in segments:
+                with open(segment.log_path, 'rb') as f:
+                    remaining = segment.size
+                    while remaining > 0 and (chunk := await asyncio.to_thread(f.read, min(1024 * 1024, remaining))):
+                        remaining -= len(chunk)
+                        uploader.write(chunk)
+                        await uploader.upload_ready()
+            
+            await uploader.close(
+                f'ルームログをお送りします！\n'
+                f'記録行数: {line_count}行\n'
+                f'ファイルサイズ: {file_size:,}バイト'
+            )
+            print(f'ログファイルをアップロードしました: {filename}')
             
         except Exception as e:
             await channel.send(f'ログファイルの送信中にエラーが発生しました: {str(e)}')
@@ -109,27 +714,156 @@ async def on_raw_reaction_add(payload):
 @bot.command(name='log_status')
 async def log_status(ctx):
     """ログファイルの状態を確認するコマンド"""
-    if ctx.channel.id != TARGET_CHANNEL_ID:
+    if ctx.channel.id not in TARGET_CHANNEL_IDS:
         return
     
-    if os.path.exists(LOG_FILE_PATH):
-        file_size = os.path.getsize(LOG_FILE_PATH)
-        with open(LOG_FILE_PATH, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            line_count = len(lines)
+    room_log = await asyncio.to_thread(channel_logs.get, ctx.channel.id)
+    if room_log.segments:
+        # ファイルは読まずにインデックスから取得
+        stats = log_writer.stats()
+        search_count = await asyncio.to_thread(search_store.count)
         
         await ctx.send(
             f'📊 ログファイル状態\n'
-            f'ファイルサイズ: {file_size:,}バイト\n'
-            f'記録行数: {line_count}行\n'
-            f'最終更新: {datetime.fromtimestamp(os.path.getmtime(LOG_FILE_PATH)).strftime("%Y-%m-%d %H:%M:%S")}'
+            f'ファイルサイズ: {room_log.size:,}バイト\n'
+            f'記録行数: {room_log.line_count}行\n'
+            f'記録期間: {room_log.first_timestamp or "-"} 〜 {room_log.last_timestamp or "-"}\n'
+            f'セグメント: {len(room_log.segments)}個（現在: {os.path.basename(room_log.current.log_path)}）\n'
+            f'書き込み待ち: {stats["queue_depth"]}行\n'
+            f'書き込み回数: {stats["flush_count"]}回（{stats["written_lines"]}行）\n'
+            f'書き込み時間: 直近 {stats["last_flush_ms"]:.1f}ms / 最大 {stats["max_flush_ms"]:.1f}ms\n'
+            f'記録対象: {len(TARGET_CHANNEL_IDS)}チャンネル（開いているファイル: {stats["open_files"]}個）\n'
+            f'検索インデックス: {search_count:,}件'
         )
     else:
         await ctx.send('ログファイルはまだ作成されていません。')
 
+def parse_log_time(text, end=False):
+    """'YYYY-MM-DD' または 'YYYY-MM-DDTHH:MM[:SS]' をログのタイムスタンプ形式に変換
+    
+    end=True の場合、省略された時刻はその日（分）の終わりとして扱う。
+    """
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if end and fmt == '%Y-%m-%d':
+            parsed = parsed.replace(hour=23, minute=59, second=59)
+        elif end and fmt == '%Y-%m-%dT%H:%M':
+            parsed = parsed.replace(second=59)
+        return parsed.strftime('%Y-%m-%d %H:%M:%S')
+    return None
+
+@bot.command(name='log_export')
+async def log_export(ctx, start_text, end_text):
+    """指定期間のログを書き出すコマンド（例: !log_export 2025-01-01 2025-01-31T12:00、時刻はUTC）"""
+    if ctx.channel.id not in TARGET_CHANNEL_IDS:
+        return
+    
+    start = parse_log_time(start_text)
+    end = parse_log_time(end_text, end=True)
+    if not start or not end or start > end:
+        await ctx.send('期間の指定が正しくありません。例: `!log_export 2025-01-01 2025-01-31`（`YYYY-MM-DDTHH:MM` も可、UTC）')
+        return
+    
+    try:
+        # バッファに残っているログを書き込んでから書き出す
+        await log_writer.flush()
+        
+        # インデックスから該当するセグメントだけを選び、その中の該当箇所だけを読む
+        room_log = await asyncio.to_thread(channel_logs.get, ctx.channel.id)
+        segments = room_log.segments_in_range(start, end)
+        if not segments:
+            await ctx.send(f'{start} 〜 {end} のログはありません。')
+            return
+        
+        filename = f'room_log_{start[:10].replace("-", "")}_{end[:10].replace("-", "")}.txt'
+        uploader = SplitUploader(ctx.channel, filename)
+        line_count = 0
+        
+        for segment in segments:
+            # ファイルの読み込みはイベントループを止めないように、1000行ずつスレッドで行う
+            lines = segment.iter_range(start, end)
+            while batch := await asyncio.to_thread(list, itertools.islice(lines, 1000)):
+                uploader.write(''.join(batch))
+                line_count += len(batch)
+                await uploader.upload_ready()
+        
+        if line_count == 0:
+            await ctx.send(f'{start} 〜 {end} のログはありません。')
+            return
+        
+        await uploader.close(
+            f'ルームログ（{start} 〜 {end}）をお送りします！\n'
+            f'記録行数: {line_count}行（{len(segments)}セグメントから抽出）'
+        )
+        print(f'期間指定ログをアップロードしました: {filename}')
+        
+    except Exception as e:
+        await ctx.send(f'ログの書き出し中にエラーが発生しました: {str(e)}')
+        print(f'ログ書き出しエラー: {e}')
+
+@bot.tree.command(name='search', description='記録したメッセージを全文検索します')
+@app_commands.describe(query='検索する語句（スペース区切りでAND検索）', channel='検索するチャンネル（省略時は記録対象の全チャンネル）')
+async def search_command(interaction: discord.Interaction, query: str, channel: discord.TextChannel = None):
+    """記録したメッセージを検索し、該当メッセージへのリンクを表示"""
+    if interaction.guild is None:
+        await interaction.response.send_message('サーバー内で使用してください。', ephemeral=True)
+        return
+    
+    # このサーバーの記録対象チャンネルのうち、実行したユーザーが読めるものだけを検索する
+    channel_ids = []
+    for channel_id in TARGET_CHANNEL_IDS:
+        target = interaction.guild.get_channel(channel_id)
+        if target is None or (channel and channel.id != channel_id):
+            continue
+        if target.permissions_for(interaction.user).read_message_history:
+            channel_ids.append(channel_id)
+    
+    if not channel_ids:
+        await interaction.response.send_message('検索できるチャンネルがありません。', ephemeral=True)
+        return
+    
+    try:
+        start = time.perf_counter()
+        results = await asyncio.to_thread(search_store.search, query, channel_ids)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except sqlite3.Error as e:
+        await interaction.response.send_message(f'検索中にエラーが発生しました: {str(e)}', ephemeral=True)
+        print(f'検索エラー: {e}')
+        return
+    
+    if not results:
+        await interaction.response.send_message(f'「{query}」に一致するメッセージは見つかりませんでした。', ephemeral=True)
+        return
+    
+    lines = []
+    for message_id, guild_id, channel_id, author, created_at, snippet in results:
+        snippet = snippet.replace('\n', ' ')
+        if len(snippet) > 200:
+            snippet = snippet[:200] + '…'
+        lines.append(
+            f'[{created_at}](https://discord.com/channels/{guild_id}/{channel_id}/{message_id}) '
+            f'<#{channel_id}> **{author}**\n{snippet}'
+        )
+    
+    embed = discord.Embed(
+        title=f'🔍 「{query}」の検索結果',
+        description='\n\n'.join(lines)[:4096],
+        color=discord.Color.blue()
+    )
+    footer = f'{len(results)}件・新しい順（{elapsed_ms:.1f}ms）'
+    if not search_store.split_query(query)[0]:
+        footer += f'\n2文字以下の語だけの検索は直近{SEARCH_SCAN_LIMIT:,}件が対象です'
+    embed.set_footer(text=footer)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 if __name__ == '__main__':
     if TOKEN is None:
         print('エラー: DISCORD_TOKENが設定されていません')
         print('.envファイルにDISCORD_TOKEN=your_bot_tokenを追加してください')
     else:
+        # 以前のバージョンのログを取り込む（メッセージの記録が始まる前に行う。各チャンネルのログは最初に使われたときに読み込む）
+        channel_logs.migrate_legacy_logs()
         bot.run(TOKEN)
\ No newline at end of file
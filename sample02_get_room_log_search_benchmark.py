@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+sample02_get_room_log.py の全文検索（/search）のベンチマーク
+
+一時ディレクトリにダミーのメッセージを指定件数（既定は100万件）登録し、
+MessageSearchStore.search のクエリ時間（p50/p95/p99）を計測します。
+
+    python sample02_get_room_log_search_benchmark.py --messages 1000000 --queries 500
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from sample02_get_room_log import MessageSearchStore, SEARCH_RESULT_LIMIT
+
+# ダミーメッセージの単語（日本語・英語を混ぜる）
+WORDS = [
+    'おはようございます', 'こんにちは', 'お疲れさまです', 'ありがとう', 'よろしくお願いします',
+    '会議', '資料', '締め切り', '確認', '修正', 'リリース', 'デプロイ', 'テスト', 'レビュー',
+    '明日', '今日', '来週', '午前', '午後', '了解です', '対応します', '共有します',
+    'discord', 'python', 'database', 'server', 'channel', 'message', 'error', 'update',
+    'bot', 'log', 'search', 'index', 'deploy', 'review', 'meeting', 'schedule',
+]
+
+# 出現頻度の低い単語（ヒット件数が少ないクエリ用）
+RARE_WORDS = ['障害報告', 'ロールバック', 'postmortem', 'incident', 'マイグレーション']
+RARE_RATE = 0.001
+
+CHANNEL_COUNT = 20
+BATCH_SIZE = 10000
+
+
+def generate_messages(count, seed):
+    """ダミーメッセージを BATCH_SIZE 件ずつ生成"""
+    rng = random.Random(seed)
+    batch = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 15))
+        if rng.random() < RARE_RATE:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(RARE_WORDS))
+        channel_id = 1000 + i % CHANNEL_COUNT
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1700000000 + i * 10))
+        batch.append((i + 1, 1, channel_id, f'user{i % 500}', created_at, ' '.join(words)))
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def percentile(values, rate):
+    """values（ソート済み）のパーセンタイル"""
+    return values[min(len(values) - 1, int(len(values) * rate))]
+
+
+def run_queries(label, store, queries, channel_ids):
+    """クエリを順に実行して p50/p95/p99 を表示"""
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = store.search(query, channel_ids, SEARCH_RESULT_LIMIT)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += bool(results)
+    latencies.sort()
+    print(
+        f"{label:<28} p50 {percentile(latencies, 0.50):>7.2f}ms  p95 {percentile(latencies, 0.95):>7.2f}ms  "
+        f"p99 {percentile(latencies, 0.99):>7.2f}ms  max {latencies[-1]:>7.2f}ms  ヒット {hits}/{len(queries)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文検索のベンチマーク')
+    parser.add_argument('--messages', type=int, default=1_000_000, help='登録するメッセージ数')
+    parser.add_argument('--queries', type=int, default=200, help='種類ごとのクエリ回数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='search_benchmark_')
+    store = MessageSearchStore(os.path.join(work_dir, 'search.db'))
+    rng = random.Random(args.seed)
+
+    try:
+        start = time.perf_counter()
+        for batch in generate_messages(args.messages, args.seed):
+            store.add_messages(batch)
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(store.db_path)
+        print(f"登録: {args.messages:,}件 {elapsed:.1f}秒（{args.messages / elapsed:,.0f}件/秒、{size / 1024 / 1024:.0f}MB）")
+
+        all_channels = list(range(1000, 1000 + CHANNEL_COUNT))
+        run_queries('よく出る語', store, [rng.choice(WORDS[:22]) for _ in range(args.queries)], all_channels)
+        run_queries('まれな語', store, [rng.choice(RARE_WORDS) for _ in range(args.queries)], all_channels)
+        run_queries(
+            '2語のAND',
+            store,
+            [f'{rng.choice(WORDS)} {rng.choice(RARE_WORDS)}' for _ in range(args.queries)],
+            all_channels
+        )
+        run_queries('1チャンネルに限定', store, [rng.choice(RARE_WORDS) for _ in range(args.queries)], all_channels[:1])
+        run_queries('2文字以下（索引なし）', store, [rng.choice(['会議', '確認', 'ok']) for _ in range(args.queries)], all_channels)
+    finally:
+        store.close()
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
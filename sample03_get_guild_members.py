@@ -1,9 +1,18 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import os
 import csv
+import asyncio
+import heapq
+import itertools
+import json
+import tempfile
+import time
+from collections import Counter
 from datetime import datetime
+from operator import itemgetter
 from dotenv import load_dotenv
+from split_upload import SplitUploader
 
 load_dotenv()
 
@@ -13,128 +22,423 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
 intents.members = True  # メンバー情報を取得するために必要
+intents.presences = True  # ステータス（オンライン/オフライン）別の人数を集計するために必要
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# メンバー一覧エクスポートの設定
+EXPORT_SORTED_EMOJI = '👍'  # 表示名順に並べ替えて出力
+EXPORT_FAST_EMOJI = '⚡'  # 並べ替えずに取得順で出力（高速・一時ファイルなし）
+FETCH_CHUNK_SIZE = 1000  # 取得側から書き込み側へ渡す人数
+FETCH_QUEUE_SIZE = 10  # 書き込みが追いつかないときに取得側が先読みするチャンク数
+SORT_RUN_SIZE = 20000  # 外部ソートで一度にメモリ上で並べ替える人数
+PROGRESS_INTERVAL = 3.0  # 進捗メッセージを更新する間隔（秒）
+
+# メンバー統計の設定
+STATS_TOP_ROLES = 5  # !member_count で表示するロールの数（人数の多い順）
+STATS_SNAPSHOT_INTERVAL = 60  # 統計のスナップショットを書き出す間隔（秒）
+STATS_SNAPSHOT_PATH = 'guild_stats.jsonl'  # スナップショットの書き出し先（1行1ギルド分のJSON）
+
+CSV_HEADER = [
+    'No',
+    'ユーザーID',
+    'ユーザー名',
+    '表示名',
+    'ディスクリミネーター',
+    'アカウント作成日',
+    'サーバー参加日',
+    'Bot',
+    'ステータス',
+    'ロール'
+]
+
+def member_record(member):
+    """メンバー1人分のレコード（並べ替えキー + CSVの列）をタプルで作成"""
+    roles = [role.name for role in member.roles if role.name != '@everyone']
+    return (
+        member.display_name.lower(),
+        str(member.id),
+        member.name,
+        member.display_name,
+        member.discriminator,
+        member.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else 'N/A',
+        'Yes' if member.bot else 'No',
+        str(member.status),
+        ', '.join(roles) if roles else 'なし'
+    )
+
+async def iter_members(guild):
+    """ギルドのメンバーを順に返す
+    
+    ゲートウェイからメンバー一覧を受信済み（guild.chunked）ならキャッシュを使い、
+    そうでなければRESTで1000人ずつ取得する。
+    """
+    if guild.chunked:
+        for i, member in enumerate(list(guild.members), 1):
+            yield member
+            if i % FETCH_CHUNK_SIZE == 0:
+                await asyncio.sleep(0)  # 他のイベントを処理できるようにする
+    else:
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
+class MemberExport:
+    """メンバー一覧をCSVに書き出しながらアップロードするクラス
+    
+    メンバーの取得と、CSVへの書き込み・アップロードを別タスクで並行して行う。
+    メンバーは1人1タプルのレコードにしてチャンクごとに渡し、全員分をメモリに持たない。
+    並べ替える場合は SORT_RUN_SIZE 人ごとに並べ替えて一時ファイルに書き出し、最後にマージする（外部ソート）。
+    進捗は1つのメッセージを編集して表示する。
+    """
+    
+    def __init__(self, guild, channel, sort=True):
+        self.guild = guild
+        self.channel = channel
+        self.sort = sort
+        current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.filename = f'guild_members_{guild.name}_{current_time}.csv'
+        
+        self.status_message = None
+        self.phase = '取得中'
+        self.last_progress = 0.0
+        self.fetched = 0
+        self.written = 0
+        self.bot_count = 0
+    
+    async def run(self):
+        """エクスポートを実行"""
+        self.status_message = await self.channel.send('サーバーのメンバー一覧を取得中です...')
+        started = time.perf_counter()
+        
+        uploader = SplitUploader(self.channel, self.filename)
+        writer = csv.writer(uploader)
+        
+        # ヘッダー情報を書き込み（人数の内訳は取得後に末尾へ書き込む）
+        writer.writerow(['# サーバー情報'])
+        writer.writerow(['サーバー名', self.guild.name])
+        writer.writerow(['サーバーID', self.guild.id])
+        writer.writerow(['取得日時', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        writer.writerow(['並び順', '表示名順' if self.sort else '取得順'])
+        writer.writerow([])  # 空行
+        writer.writerow(CSV_HEADER)
+        
+        queue = asyncio.Queue(maxsize=FETCH_QUEUE_SIZE)
+        fetch_task = asyncio.create_task(self._fetch(queue))
+        try:
+            if self.sort:
+                await self._write_sorted(queue, writer, uploader)
+            else:
+                await self._write_chunks(self._drain(queue), writer, uploader)
+            await fetch_task  # 取得中のエラーを送出
+        finally:
+            fetch_task.cancel()
+        
+        # 集計を末尾に書き込み
+        human_count = self.fetched - self.bot_count
+        writer.writerow([])
+        writer.writerow(['# 集計'])
+        writer.writerow(['総メンバー数', f'{self.fetched}人'])
+        writer.writerow(['人間', f'{human_count}人'])
+        writer.writerow(['Bot', f'{self.bot_count}人'])
+        
+        # 残りをDiscordにアップロード
+        await uploader.close(
+            f'サーバー「{self.guild.name}」のメンバー一覧を取得しました！\n'
+            f'総メンバー数: {self.fetched}人\n'
+            f'人間: {human_count}人 / Bot: {self.bot_count}人\n'
+            f'ファイルサイズ: {uploader.total_bytes:,}バイト'
+        )
+        
+        await self._progress(done=f'✅ メンバー一覧を作成しました（{time.perf_counter() - started:.1f}秒）')
+    
+    async def _fetch(self, queue):
+        """メンバーを取得してレコードのチャンクをキューに入れる（最後に None）"""
+        chunk = []
+        try:
+            async for member in iter_members(self.guild):
+                chunk.append(member_record(member))
+                self.fetched += 1
+                if member.bot:
+                    self.bot_count += 1
+                if len(chunk) >= FETCH_CHUNK_SIZE:
+                    await queue.put(chunk)
+                    chunk = []
+            if chunk:
+                await queue.put(chunk)
+        finally:
+            # エラー時も書き込み側が待ち続けないように終了を通知
+            await queue.put(None)
+    
+    async def _drain(self, queue):
+        """キューからチャンクを順に取り出す"""
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+    
+    async def _write_chunks(self, chunks, writer, uploader):
+        """レコードのチャンクをCSVに書き込み、上限に達したパートをアップロード"""
+        async for chunk in chunks:
+            for record in chunk:
+                self.written += 1
+                writer.writerow((self.written, *record[1:]))
+            await uploader.upload_ready()
+            await self._progress()
+    
+    async def _write_sorted(self, queue, writer, uploader):
+        """表示名順に並べ替えて書き込む（人数が多い場合は一時ファイルを使う外部ソート）"""
+        with tempfile.TemporaryDirectory(prefix='guild_members_') as temp_dir:
+            run_paths = []
+            buffer = []
+            async for chunk in self._drain(queue):
+                buffer.extend(chunk)
+                if len(buffer) >= SORT_RUN_SIZE:
+                    run_paths.append(await asyncio.to_thread(self._write_run, temp_dir, len(run_paths), buffer))
+                    buffer = []
+                    await self._progress()
+            
+            if not run_paths:
+                # 全員がメモリに収まる場合は一時ファイルを使わない
+                buffer.sort(key=itemgetter(0))
+                self.phase = '書き込み中'
+                await self._write_chunks(self._chunks(buffer), writer, uploader)
+                return
+            
+            if buffer:
+                run_paths.append(await asyncio.to_thread(self._write_run, temp_dir, len(run_paths), buffer))
+                buffer = []
+            
+            self.phase = f'{len(run_paths)}個の一時ファイルをマージ中'
+            await self._write_chunks(self._merge_runs(run_paths), writer, uploader)
+    
+    @staticmethod
+    def _write_run(temp_dir, index, records):
+        """並べ替えたレコードを一時ファイルに書き出す（スレッド内で実行）"""
+        records.sort(key=itemgetter(0))
+        path = os.path.join(temp_dir, f'run_{index:04d}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(records)
+        return path
+    
+    @staticmethod
+    async def _chunks(records):
+        """メモリ上のレコードをチャンクに分けて返す"""
+        for start in range(0, len(records), FETCH_CHUNK_SIZE):
+            yield records[start:start + FETCH_CHUNK_SIZE]
+    
+    @staticmethod
+    async def _merge_runs(run_paths):
+        """一時ファイルをマージしながらチャンクごとに返す（読み込みはスレッド内で実行）"""
+        files = [open(path, newline='', encoding='utf-8') for path in run_paths]
+        try:
+            merged = heapq.merge(*(csv.reader(f) for f in files), key=itemgetter(0))
+            while chunk := await asyncio.to_thread(lambda: list(itertools.islice(merged, FETCH_CHUNK_SIZE))):
+                yield chunk
+        finally:
+            for f in files:
+                f.close()
+    
+    async def _progress(self, done=None):
+        """進捗メッセージを更新（PROGRESS_INTERVAL 秒に1回まで。done を指定した場合は必ず更新）"""
+        now = time.monotonic()
+        if not done and now - self.last_progress < PROGRESS_INTERVAL:
+            return
+        self.last_progress = now
+        
+        total = self.guild.member_count or self.fetched
+        try:
+            await self.status_message.edit(
+                content=f'{done or f"📥 メンバー一覧を作成中...（{self.phase}）"}\n'
+                        f'取得: {self.fetched:,} / {total:,}人\n'
+                        f'書き込み: {self.written:,}人'
+            )
+        except discord.HTTPException as e:
+            print(f'進捗メッセージの更新に失敗しました: {e}')
+
+class GuildStats:
+    """ギルドのメンバー統計（総数・Bot数・ステータス別・ロール別）を差分で更新するクラス
+    
+    ギルドが使えるようになった時に一度だけ guild.members を数え、その後は
+    参加・退出・ロール変更・ステータス変更のイベントで増減させる。統計の取得は O(1)。
+    """
+    
+    def __init__(self):
+        self.guilds = {}  # ギルドID -> 集計（総数・Bot数・ステータス別・ロール別）
+    
+    def rebuild(self, guild):
+        """ギルドのメンバーを数え直す"""
+        self.guilds[guild.id] = {
+            'total': 0,
+            'bots': 0,
+            'statuses': Counter(),  # ステータス名 -> 人数
+            'roles': Counter(),  # ロールID -> 人数
+        }
+        for member in guild.members:
+            self.add_member(member)
+    
+    def remove_guild(self, guild):
+        self.guilds.pop(guild.id, None)
+    
+    def add_member(self, member, delta=1):
+        """メンバーを集計に加える（delta=-1 で取り除く）"""
+        counts = self.guilds.get(member.guild.id)
+        if counts is None:
+            return
+        counts['total'] += delta
+        if member.bot:
+            counts['bots'] += delta
+        counts['statuses'][str(member.status)] += delta
+        for role in member.roles:
+            if not role.is_default():
+                counts['roles'][role.id] += delta
+    
+    def remove_member(self, member):
+        self.add_member(member, delta=-1)
+    
+    def update_roles(self, before, after):
+        """ロールの付け外しを反映"""
+        counts = self.guilds.get(after.guild.id)
+        if counts is None or before.roles == after.roles:
+            return
+        before_ids = {role.id for role in before.roles if not role.is_default()}
+        after_ids = {role.id for role in after.roles if not role.is_default()}
+        for role_id in before_ids - after_ids:
+            counts['roles'][role_id] -= 1
+        for role_id in after_ids - before_ids:
+            counts['roles'][role_id] += 1
+    
+    def update_status(self, before, after):
+        """ステータスの変化を反映"""
+        counts = self.guilds.get(after.guild.id)
+        if counts is None or before.status == after.status:
+            return
+        counts['statuses'][str(before.status)] -= 1
+        counts['statuses'][str(after.status)] += 1
+    
+    def remove_role(self, role):
+        """削除されたロールを集計から取り除く"""
+        counts = self.guilds.get(role.guild.id)
+        if counts is not None:
+            counts['roles'].pop(role.id, None)
+    
+    def get(self, guild):
+        """ギルドの統計を取得（ロールは人数の多い順に (ロール, 人数)）"""
+        counts = self.guilds.get(guild.id)
+        if counts is None:
+            return None
+        offline = counts['statuses'][str(discord.Status.offline)]
+        roles = [
+            (guild.get_role(role_id), count)
+            for role_id, count in counts['roles'].most_common()
+            if count > 0 and guild.get_role(role_id)
+        ]
+        return {
+            'total': counts['total'],
+            'bots': counts['bots'],
+            'humans': counts['total'] - counts['bots'],
+            'online': counts['total'] - offline,
+            'statuses': {status: count for status, count in counts['statuses'].items() if count > 0},
+            'roles': roles,
+        }
+    
+    def snapshot(self, guild):
+        """メトリクスとして書き出す形式の統計"""
+        stats = self.get(guild)
+        if stats is None:
+            return None
+        return {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'guild_id': guild.id,
+            'guild_name': guild.name,
+            'total': stats['total'],
+            'bots': stats['bots'],
+            'humans': stats['humans'],
+            'online': stats['online'],
+            'statuses': stats['statuses'],
+            'roles': {role.name: count for role, count in stats['roles']},
+        }
+
+guild_stats = GuildStats()
+
+def write_snapshots(snapshots):
+    """統計のスナップショットをファイルに追記（スレッド内で実行）"""
+    with open(STATS_SNAPSHOT_PATH, 'a', encoding='utf-8') as f:
+        for snapshot in snapshots:
+            f.write(json.dumps(snapshot, ensure_ascii=False) + '\n')
+
+@tasks.loop(seconds=STATS_SNAPSHOT_INTERVAL)
+async def stats_snapshot():
+    """全ギルドの統計を定期的に書き出す"""
+    snapshots = [snapshot for guild in bot.guilds if (snapshot := guild_stats.snapshot(guild))]
+    if snapshots:
+        try:
+            await asyncio.to_thread(write_snapshots, snapshots)
+        except OSError as e:
+            print(f'統計スナップショットの書き込みエラー: {e}')
+
 @bot.event
 async def on_ready():
     print(f'{bot.user}としてログインしました！')
-    print('グッドマークのリアクションでサーバーのメンバー一覧を取得します')
+    print(f'{EXPORT_SORTED_EMOJI}リアクションでサーバーのメンバー一覧を取得します（{EXPORT_FAST_EMOJI}で並べ替えなしの高速モード）')
+    
+    # メンバー統計の初期集計（メンバー一覧の受信後に数える。以降はイベントで差分更新）
+    for guild in bot.guilds:
+        guild_stats.rebuild(guild)
+    if not stats_snapshot.is_running():
+        stats_snapshot.start()
+    print(f'{len(bot.guilds)}個のサーバーのメンバー統計を集計しました（{STATS_SNAPSHOT_INTERVAL}秒ごとに {STATS_SNAPSHOT_PATH} へ書き出し）')
+
+@bot.event
+async def on_guild_available(guild):
+    # 起動後に障害などから復旧したギルドは数え直す（起動時は on_ready で数える）
+    if bot.is_ready():
+        guild_stats.rebuild(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    guild_stats.rebuild(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    guild_stats.remove_guild(guild)
+
+@bot.event
+async def on_member_join(member):
+    guild_stats.add_member(member)
+
+@bot.event
+async def on_member_remove(member):
+    guild_stats.remove_member(member)
+
+@bot.event
+async def on_member_update(before, after):
+    guild_stats.update_roles(before, after)
+
+@bot.event
+async def on_presence_update(before, after):
+    guild_stats.update_status(before, after)
+
+@bot.event
+async def on_guild_role_delete(role):
+    guild_stats.remove_role(role)
 
 @bot.event
 async def on_raw_reaction_add(payload):
     if payload.user_id == bot.user.id:
         return
     
-    # サムズアップ（👍）リアクションの場合
-    if str(payload.emoji) == '👍':
+    # サムズアップ（👍）は表示名順、⚡は取得順（並べ替えなし）でエクスポート
+    emoji = str(payload.emoji)
+    if emoji in (EXPORT_SORTED_EMOJI, EXPORT_FAST_EMOJI):
         channel = bot.get_channel(payload.channel_id)
         guild = channel.guild if channel else None
         
         if not channel or not guild:
             return
         
-        await channel.send('サーバーのメンバー一覧を取得中です...')
-        
+        export = MemberExport(guild, channel, sort=(emoji == EXPORT_SORTED_EMOJI))
         try:
-            # メンバー一覧を取得
-            members = []
-            member_count = 0
-            
-            # ギルドのメンバーを取得
-            async for member in guild.fetch_members(limit=None):
-                member_info = {
-                    'id': member.id,
-                    'name': member.name,
-                    'display_name': member.display_name,
-                    'discriminator': member.discriminator,
-                    'joined_at': member.joined_at.strftime('%Y-%m-%d %H:%M:%S') if member.joined_at else 'N/A',
-                    'created_at': member.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    'is_bot': member.bot,
-                    'status': str(member.status),
-                    'roles': [role.name for role in member.roles if role.name != '@everyone']
-                }
-                members.append(member_info)
-                member_count += 1
-            
-            # メンバーを名前順にソート
-            members.sort(key=lambda x: x['display_name'].lower())
-            
-            # CSVファイルを作成
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'guild_members_{guild.name}_{current_time}.csv'
-            filepath = f'/tmp/{filename}'
-            
-            # 統計情報を計算
-            bot_count = sum(1 for m in members if m['is_bot'])
-            human_count = len(members) - bot_count
-            
-            with open(filepath, 'w', encoding='utf-8', newline='') as f:
-                # CSVライターを作成
-                writer = csv.writer(f)
-                
-                # ヘッダー情報を書き込み
-                writer.writerow(['# サーバー情報'])
-                writer.writerow(['サーバー名', guild.name])
-                writer.writerow(['サーバーID', guild.id])
-                writer.writerow(['取得日時', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-                writer.writerow(['総メンバー数', f'{len(members)}人'])
-                writer.writerow(['人間', f'{human_count}人'])
-                writer.writerow(['Bot', f'{bot_count}人'])
-                writer.writerow([])  # 空行
-                
-                # CSVヘッダーを書き込み
-                writer.writerow([
-                    'No',
-                    'ユーザーID',
-                    'ユーザー名',
-                    '表示名',
-                    'ディスクリミネーター',
-                    'アカウント作成日',
-                    'サーバー参加日',
-                    'Bot',
-                    'ステータス',
-                    'ロール'
-                ])
-                
-                # メンバーデータを書き込み
-                for i, member in enumerate(members, 1):
-                    writer.writerow([
-                        i,
-                        member['id'],
-                        member['name'],
-                        member['display_name'],
-                        member['discriminator'],
-                        member['created_at'],
-                        member['joined_at'],
-                        'Yes' if member['is_bot'] else 'No',
-                        member['status'],
-                        ', '.join(member['roles']) if member['roles'] else 'なし'
-                    ])
-            
-            # ファイルサイズをチェック
-            file_size = os.path.getsize(filepath)
-            
-            # ファイルサイズが25MB以下かチェック（Discordの制限）
-            if file_size > 25 * 1024 * 1024:  # 25MB
-                await channel.send('メンバーリストが大きすぎます（25MB以上）。ファイルを分割する必要があります。')
-                os.remove(filepath)
-                return
-            
-            # ファイルをDiscordにアップロード
-            with open(filepath, 'rb') as f:
-                discord_file = discord.File(f, filename)
-                await channel.send(
-                    f'サーバー「{guild.name}」のメンバー一覧を取得しました！\n'
-                    f'総メンバー数: {len(members)}人\n'
-                    f'人間: {human_count}人 / Bot: {bot_count}人\n'
-                    f'ファイルサイズ: {file_size:,}バイト',
-                    file=discord_file
-                )
-            
-            # 一時ファイルを削除
-            os.remove(filepath)
-            print(f'メンバーリストをアップロードしました: {filename}')
+            await export.run()
+            print(f'メンバーリストをアップロードしました: {export.filename}')
             
         except discord.Forbidden:
             await channel.send('エラー: メンバー情報を取得する権限がありません。Botに「メンバーを表示」権限を与えてください。')
@@ -151,17 +455,25 @@ async def member_count(ctx):
         return
     
     try:
-        member_count = guild.member_count
-        online_members = sum(1 for member in guild.members if member.status != discord.Status.offline)
-        bot_count = sum(1 for member in guild.members if member.bot)
-        human_count = member_count - bot_count
+        # イベントで更新している集計から取得（メンバーを数え直さない）
+        stats = guild_stats.get(guild)
+        if stats is None:
+            guild_stats.rebuild(guild)
+            stats = guild_stats.get(guild)
+        
+        statuses = ' / '.join(f'{status}: {count}人' for status, count in sorted(stats['statuses'].items()))
+        top_roles = '\n'.join(
+            f'　{role.name}: {count}人' for role, count in stats['roles'][:STATS_TOP_ROLES]
+        ) or '　なし'
         
         await ctx.send(
             f'📊 サーバー「{guild.name}」の統計\n'
-            f'総メンバー数: {member_count}人\n'
-            f'オンライン: {online_members}人\n'
-            f'人間: {human_count}人\n'
-            f'Bot: {bot_count}人'
+            f'総メンバー数: {stats["total"]}人\n'
+            f'オンライン: {stats["online"]}人\n'
+            f'人間: {stats["humans"]}人\n'
+            f'Bot: {stats["bots"]}人\n'
+            f'ステータス別: {statuses or "-"}\n'
+            f'ロール別（上位{STATS_TOP_ROLES}件）:\n{top_roles}'
         )
     except Exception as e:
         await ctx.send(f'メンバー数の取得中にエラーが発生しました: {str(e)}')
@@ -171,6 +483,6 @@ if __name__ == '__main__':
         print('エラー: DISCORD_TOKENが設定されていません')
         print('.envファイルにDISCORD_TOKEN=your_bot_tokenを追加してください')
     else:
-        print('注意: このBotは「members」インテントが必要です。')
-        print('Discord Developer Portalで「Server Members Intent」を有効にしてください。')
+        print('注意: このBotは「members」と「presences」インテントが必要です。')
+        print('Discord Developer Portalで「Server Members Intent」と「Presence Intent」を有効にしてください。')
         bot.run(TOKEN)
\ No newline at end of file
@@ -1,8 +1,17 @@
 import discord
 from discord.ext import commands
 import os
+import asyncio
+import csv
+import json
+import random
+import re
+import secrets
+import time
 from datetime import datetime
 from dotenv import load_dotenv
+from member_cache import MemberResolver
+from split_upload import SplitUploader
 
 load_dotenv()
 
@@ -25,12 +34,392 @@ TARGET_USER_IDS = [
 # 付与するロールID
 TARGET_ROLE_ID = 1394560899800633344
 
+# 一括付与の設定
+# ロール付与のAPIはギルド単位で同じレート制限バケットを共有するため、同時実行数を増やしても
+# バケットの上限以上には速くならない（discord.py がバケットの残り回数に合わせて待機する）。
+# 上限に近い値にして、待機中も次のリクエストが並ぶようにする。
+ROLE_GRANT_CONCURRENCY = 10
+ROLE_GRANT_MAX_RETRIES = 5  # 429（レート制限）や5xxエラー時の再試行回数
+ROLE_GRANT_RETRY_BASE_DELAY = 1.0  # 再試行の待機時間（秒、2倍ずつ増やす）
+QUERY_MEMBERS_BATCH_SIZE = 100  # guild.query_members で一度に問い合わせられる人数
+PROGRESS_INTERVAL = 3.0  # 進捗メッセージを更新する間隔（秒）
+
+# ロール付与ジョブの保存先（ジョブ情報とユーザーごとの結果を保存し、再起動後に途中から再開する）
+ROLE_JOBS_DIR = 'role_jobs'
+ROLE_JOBS_SHOWN = 10  # !role_jobs で表示するジョブ数（新しい順）
+JOB_ID_PATTERN = re.compile(r'^\d{14}-[0-9a-f]{4}$')
+
+# ファイルからユーザーIDを読み取る（Discordのユーザー IDは17〜20桁）
+USER_ID_PATTERN = re.compile(r'\b\d{17,20}\b')
+
+# 付与結果の種類と表示名
+RESULT_LABELS = {
+    'success': '成功',
+    'already': '既に保有',
+    'not_found': 'ユーザー未発見',
+    'forbidden': '権限不足',
+    'error': 'エラー',
+}
+
+# メンバー取得キャッシュ
+member_resolver = MemberResolver()
+
+def parse_user_ids(text):
+    """テキストからユーザーIDを重複なしで取り出す（出現順）"""
+    return list(dict.fromkeys(int(user_id) for user_id in USER_ID_PATTERN.findall(text)))
+
+class RoleGrantJob:
+    """ファイルに保存するロール付与ジョブ
+    
+    ジョブ情報（対象ユーザー・付与するロール・状態）は <ジョブID>.json に保存し、
+    ユーザーごとの結果は <ジョブID>.results.jsonl に1人1行で追記する。
+    再開時は結果が記録済みのユーザーを除いて続きから処理する（記録前に止まったユーザーも、
+    付与済みであればキャッシュ上のロールで「既に保有」としてスキップされる）。
+    """
+    
+    def __init__(self, job_id, guild_id, channel_id, role_id, user_ids, status='running', created_at=None):
+        self.job_id = job_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.role_id = role_id
+        self.user_ids = user_ids
+        self.status = status  # running / completed / cancelled / failed
+        self.created_at = created_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.results_file = None
+    
+    @property
+    def path(self):
+        return os.path.join(ROLE_JOBS_DIR, f'{self.job_id}.json')
+    
+    @property
+    def results_path(self):
+        return os.path.join(ROLE_JOBS_DIR, f'{self.job_id}.results.jsonl')
+    
+    @classmethod
+    def create(cls, guild, channel, role, user_ids):
+        """新しいジョブを作成して保存"""
+        job_id = f'{datetime.now().strftime("%Y%m%d%H%M%S")}-{secrets.token_hex(2)}'
+        job = cls(job_id, guild.id, channel.id, role.id, list(user_ids))
+        job.save()
+        return job
+    
+    @classmethod
+    def load(cls, job_id):
+        """ジョブを読み込む（存在しない場合は None）"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        path = os.path.join(ROLE_JOBS_DIR, f'{job_id}.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(**json.load(f))
+    
+    @classmethod
+    def load_all(cls):
+        """保存されているジョブを古い順にすべて読み込む"""
+        if not os.path.isdir(ROLE_JOBS_DIR):
+            return []
+        job_ids = sorted(
+            filename.removesuffix('.json') for filename in os.listdir(ROLE_JOBS_DIR)
+            if filename.endswith('.json')
+        )
+        return [job for job in map(cls.load, job_ids) if job]
+    
+    def save(self):
+        """ジョブ情報を保存（一時ファイルに書いてから置き換えるので、途中で落ちても壊れない）"""
+        os.makedirs(ROLE_JOBS_DIR, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'job_id': self.job_id,
+                'guild_id': self.guild_id,
+                'channel_id': self.channel_id,
+                'role_id': self.role_id,
+                'user_ids': self.user_ids,
+                'status': self.status,
+                'created_at': self.created_at,
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def load_results(self):
+        """記録済みの結果を読み込む（書きかけで壊れた行は無視）"""
+        results = []
+        if not os.path.exists(self.results_path):
+            return results
+        with open(self.results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    results.append(tuple(json.loads(line)))
+                except json.JSONDecodeError:
+                    continue
+        return results
+    
+    def append_result(self, result):
+        """1人分の結果を追記（行単位でファイルに書き出す）"""
+        if self.results_file is None:
+            # 書きかけの行で止まっていた場合は改行して、次の結果と同じ行にならないようにする
+            partial = False
+            if os.path.exists(self.results_path) and os.path.getsize(self.results_path) > 0:
+                with open(self.results_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    partial = f.read(1) != b'\n'
+            self.results_file = open(self.results_path, 'a', encoding='utf-8', buffering=1)
+            if partial:
+                self.results_file.write('\n')
+        self.results_file.write(json.dumps(list(result), ensure_ascii=False) + '\n')
+    
+    def finish(self, status):
+        """ジョブを終了状態にして保存"""
+        if self.results_file:
+            self.results_file.close()
+            self.results_file = None
+        self.status = status
+        self.save()
+
+class RoleGrantEngine:
+    """多数のユーザーにロールを一括付与するクラス
+    
+    メンバーはまずゲートウェイのキャッシュからまとめて取得し、見つからないユーザーだけを
+    guild.query_members で100人ずつ問い合わせる（1人ずつRESTで取得しない）。
+    既にロールを持っているメンバーはAPIを呼ばずにスキップし、残りを同時実行数を制限して付与する。
+    429（レート制限）や5xxエラーは待機時間を延ばしながら再試行する。
+    結果は1人ごとに on_result にも渡す（ジョブの保存用）。
+    """
+    
+    def __init__(self, guild, role, concurrency=ROLE_GRANT_CONCURRENCY, max_retries=ROLE_GRANT_MAX_RETRIES, on_result=None):
+        self.guild = guild
+        self.role = role
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.on_result = on_result
+        self.cancelled = False
+        
+        self.results = []  # (ユーザーID, 表示名, 結果, 試行回数, 詳細)
+        self.counts = dict.fromkeys(RESULT_LABELS, 0)
+        self.resumed = 0  # 前回までに処理済みの人数
+        self.retries = 0
+        self.total = 0
+        self.started = None
+        self.elapsed = 0.0
+    
+    @property
+    def done(self):
+        return len(self.results)
+    
+    @property
+    def rate(self):
+        """今回の付与の処理速度（人/秒）"""
+        elapsed = self.elapsed or (time.perf_counter() - self.started if self.started else 0)
+        return (self.done - self.resumed) / elapsed if elapsed else 0.0
+    
+    def preload(self, results):
+        """前回までの結果を読み込む（再開時）"""
+        for result in results:
+            self.results.append(result)
+            self.counts[result[2]] += 1
+        self.resumed = len(results)
+    
+    def cancel(self):
+        """まだ処理していないユーザーへの付与を中止"""
+        self.cancelled = True
+    
+    async def resolve_members(self, user_ids):
+        """ユーザーIDからメンバーをまとめて取得（見つからない場合は None）"""
+        members = {user_id: self.guild.get_member(user_id) for user_id in user_ids}
+        missing = [user_id for user_id, member in members.items() if member is None]
+        
+        # キャッシュにないユーザーはゲートウェイでまとめて問い合わせる
+        for start in range(0, len(missing), QUERY_MEMBERS_BATCH_SIZE):
+            batch = missing[start:start + QUERY_MEMBERS_BATCH_SIZE]
+            try:
+                found = await self.guild.query_members(user_ids=batch, limit=len(batch))
+            except asyncio.TimeoutError:
+                # 問い合わせに失敗した分は1人ずつ取得する
+                found = [member for member in await asyncio.gather(
+                    *(member_resolver.resolve(self.guild, user_id) for user_id in batch)
+                ) if member]
+            for member in found:
+                members[member.id] = member
+        
+        return members
+    
+    async def run(self, user_ids, progress=None):
+        """ロールを一括付与。progress を指定すると処理中に定期的に呼び出す"""
+        self.started = time.perf_counter()
+        self.total = self.resumed + len(user_ids)
+        members = await self.resolve_members(user_ids)
+        
+        async def grant(user_id):
+            await self._grant(user_id, members.get(user_id))
+            if progress:
+                await progress(self)
+        
+        await asyncio.gather(*(grant(user_id) for user_id in user_ids))
+        self.elapsed = time.perf_counter() - self.started
+        return self.results
+    
+    def _record(self, user_id, member, result, attempts=0, detail=''):
+        name = member.display_name if member else ''
+        self.results.append((user_id, name, result, attempts, detail))
+        self.counts[result] += 1
+        if self.on_result:
+            self.on_result(self.results[-1])
+    
+    async def _grant(self, user_id, member):
+        """1人にロールを付与（結果を記録。中止された場合は記録せずに戻る）"""
+        if self.cancelled:
+            return
+        if member is None:
+            self._record(user_id, None, 'not_found')
+            return
+        if self.role in member.roles:
+            self._record(user_id, member, 'already')
+            return
+        
+        async with self.semaphore:
+            if self.cancelled:
+                return
+            for attempt in range(1, self.max_retries + 2):
+                try:
+                    await member.add_roles(self.role, reason='Bot経由での一括ロール付与')
+                    member_resolver.invalidate(self.guild.id, user_id)
+                    self._record(user_id, member, 'success', attempt)
+                    return
+                except discord.Forbidden:
+                    self._record(user_id, member, 'forbidden', attempt, '権限不足でロール付与できません')
+                    return
+                except discord.NotFound:
+                    self._record(user_id, member, 'not_found', attempt, 'サーバーから退出しています')
+                    return
+                except discord.HTTPException as e:
+                    if (e.status == 429 or e.status >= 500) and attempt <= self.max_retries:
+                        self.retries += 1
+                        delay = ROLE_GRANT_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                        continue
+                    self._record(user_id, member, 'error', attempt, f'{e.status} {e.text}')
+                    return
+                except Exception as e:
+                    self._record(user_id, member, 'error', attempt, str(e))
+                    return
+
+# 実行中のジョブ（ジョブID -> RoleGrantEngine）とそのタスク
+active_jobs = {}
+job_tasks = set()
+
+async def run_role_grant(channel, guild, user_ids):
+    """ロール付与ジョブを作成して実行"""
+    target_role = guild.get_role(TARGET_ROLE_ID)
+    if not target_role:
+        await channel.send(f'エラー: ロールID {TARGET_ROLE_ID} が見つかりません。')
+        return
+    
+    job = await asyncio.to_thread(RoleGrantJob.create, guild, channel, target_role, user_ids)
+    await run_role_job(job, channel, guild)
+
+async def run_role_job(job, channel, guild):
+    """ジョブを実行（再開時は結果が記録済みのユーザーを除く）し、進捗を1つのメッセージに表示して結果ファイルを送信"""
+    target_role = guild.get_role(job.role_id)
+    if not target_role:
+        await channel.send(f'エラー: ジョブ `{job.job_id}` のロールID {job.role_id} が見つかりません。')
+        await asyncio.to_thread(job.finish, 'failed')
+        return
+    
+    previous = await asyncio.to_thread(job.load_results)
+    done_ids = {result[0] for result in previous}
+    remaining = [user_id for user_id in job.user_ids if user_id not in done_ids]
+    
+    engine = RoleGrantEngine(guild, target_role, on_result=job.append_result)
+    engine.preload(previous)
+    active_jobs[job.job_id] = engine
+    
+    action = '再開' if previous else '開始'
+    status_message = await channel.send(
+        f'ロール付与ジョブ `{job.job_id}` を{action}します...（対象: {len(job.user_ids)}人、残り: {len(remaining)}人）\n'
+        f'`!role_job {job.job_id}` で進捗確認、`!role_job_cancel {job.job_id}` で中止できます'
+    )
+    last_progress = time.monotonic()
+    
+    async def show_progress(engine):
+        nonlocal last_progress
+        now = time.monotonic()
+        if now - last_progress < PROGRESS_INTERVAL:
+            return
+        last_progress = now
+        try:
+            await status_message.edit(
+                content=f'⏳ ロール付与中（ジョブ `{job.job_id}`）... {engine.done:,} / {engine.total:,}人'
+                        f'（{engine.rate:.1f}人/秒、再試行 {engine.retries}回）'
+            )
+        except discord.HTTPException as e:
+            print(f'進捗メッセージの更新に失敗しました: {e}')
+    
+    try:
+        await engine.run(remaining, progress=show_progress)
+    except Exception as e:
+        await asyncio.to_thread(job.finish, 'failed')
+        await channel.send(f'ロール付与処理中にエラーが発生しました: {str(e)}')
+        print(f'ロール付与エラー: {e}')
+        return
+    finally:
+        active_jobs.pop(job.job_id, None)
+    
+    status = 'cancelled' if engine.cancelled else 'completed'
+    await asyncio.to_thread(job.finish, status)
+    
+    counts = engine.counts
+    title = 'ロール付与ジョブを中止しました' if engine.cancelled else 'ロール付与処理が完了しました！'
+    summary = (
+        f'{title}（ジョブ `{job.job_id}`）\n'
+        f'ロール: {target_role.name}\n'
+        f'成功: {counts["success"]}人 / 既に保有: {counts["already"]}人\n'
+        f'未発見: {counts["not_found"]}人 / 権限不足: {counts["forbidden"]}人 / エラー: {counts["error"]}人\n'
+        f'処理済み: {engine.done}人 / 合計: {engine.total}人'
+        f'（今回 {engine.elapsed:.1f}秒、{engine.rate:.1f}人/秒、再試行 {engine.retries}回）'
+    )
+    try:
+        await status_message.edit(content=f'{"⏹️" if engine.cancelled else "✅"} {title}（{engine.done:,} / {engine.total:,}人）')
+    except discord.HTTPException:
+        pass
+    
+    # ユーザーごとの結果をCSVで送信（再開前の結果も含む）
+    uploader = SplitUploader(channel, f'role_grant_result_{job.job_id}.csv')
+    writer = csv.writer(uploader)
+    writer.writerow(['ユーザーID', '表示名', '結果', '試行回数', '詳細'])
+    for user_id, name, result, attempts, detail in engine.results:
+        writer.writerow([user_id, name, RESULT_LABELS[result], attempts, detail])
+    await uploader.close(summary)
+    print(f'ロール付与ジョブ {job.job_id} {status}: 成功{counts["success"]}人, エラー{counts["error"] + counts["forbidden"]}人, {engine.rate:.1f}人/秒')
+
+async def resume_role_jobs():
+    """再起動前に実行中だったジョブを再開"""
+    jobs = await asyncio.to_thread(RoleGrantJob.load_all)
+    for job in jobs:
+        if job.status != 'running' or job.job_id in active_jobs:
+            continue
+        guild = bot.get_guild(job.guild_id)
+        channel = bot.get_channel(job.channel_id)
+        if not guild or not channel:
+            print(f'ジョブ {job.job_id} のサーバーまたはチャンネルが見つからないため再開できません')
+            continue
+        
+        print(f'ロール付与ジョブ {job.job_id} を再開します')
+        task = asyncio.create_task(run_role_job(job, channel, guild))
+        job_tasks.add(task)
+        task.add_done_callback(job_tasks.discard)
+
 @bot.event
 async def on_ready():
     print(f'{bot.user}としてログインしました！')
     print('グッドマークのリアクションで指定されたユーザーにロールを付与します')
+    print('!grant_role（ファイル添付）/ !grant_role_from @ロール で一括付与もできます')
     print(f'対象ユーザー数: {len(TARGET_USER_IDS)}人')
     print(f'付与するロールID: {TARGET_ROLE_ID}')
+    
+    # 途中で止まったロール付与ジョブを再開
+    await resume_role_jobs()
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -45,100 +434,106 @@ async def on_raw_reaction_add(payload):
         if not channel or not guild:
             return
         
-        await channel.send('ロール付与処理を開始します...')
-        
-        try:
-            # 付与するロールを取得
-            target_role = guild.get_role(TARGET_ROLE_ID)
-            if not target_role:
-                await channel.send(f'エラー: ロールID {TARGET_ROLE_ID} が見つかりません。')
-                return
-            
-            success_count = 0
-            error_count = 0
-            not_found_count = 0
-            already_has_count = 0
-            results = []
-            
-            # 各ユーザーにロールを付与
-            for user_id in TARGET_USER_IDS:
-                try:
-                    # ギルドからメンバーを取得
-                    member = guild.get_member(user_id)
-                    if not member:
-                        # キャッシュにない場合はfetchで取得を試行
-                        try:
-                            member = await guild.fetch_member(user_id)
-                        except discord.NotFound:
-                            results.append(f'❌ {user_id}: ユーザーがサーバーに見つかりません')
-                            not_found_count += 1
-                            continue
-                    
-                    # 既にロールを持っているかチェック
-                    if target_role in member.roles:
-                        results.append(f'⚠️ {member.display_name} ({user_id}): 既にロールを持っています')
-                        already_has_count += 1
-                        continue
-                    
-                    # ロールを付与
-                    await member.add_roles(target_role, reason='Bot経由でのロール付与')
-                    results.append(f'✅ {member.display_name} ({user_id}): ロール付与成功')
-                    success_count += 1
-                    
-                except discord.Forbidden:
-                    results.append(f'❌ {user_id}: 権限不足でロール付与できません')
-                    error_count += 1
-                except Exception as e:
-                    results.append(f'❌ {user_id}: エラー - {str(e)}')
-                    error_count += 1
-            
-            # 結果をテキストファイルに保存
-            current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'role_grant_result_{current_time}.txt'
-            filepath = f'/tmp/{filename}'
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f'ロール付与処理結果\n')
-                f.write(f'実行日時: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n')
-                f.write(f'サーバー: {guild.name} ({guild.id})\n')
-                f.write(f'付与ロール: {target_role.name} ({TARGET_ROLE_ID})\n')
-                f.write('=' * 60 + '\n\n')
-                
-                f.write(f'処理結果サマリー:\n')
-                f.write(f'  成功: {success_count}人\n')
-                f.write(f'  既に保有: {already_has_count}人\n')
-                f.write(f'  ユーザー未発見: {not_found_count}人\n')
-                f.write(f'  エラー: {error_count}人\n')
-                f.write(f'  合計: {len(TARGET_USER_IDS)}人\n\n')
-                f.write('=' * 60 + '\n\n')
-                
-                f.write('詳細結果:\n')
-                for result in results:
-                    f.write(f'{result}\n')
-            
-            # 結果をDiscordに送信
-            summary_message = (
-                f'ロール付与処理が完了しました！\n'
-                f'ロール: {target_role.name}\n'
-                f'成功: {success_count}人 / 既に保有: {already_has_count}人\n'
-                f'未発見: {not_found_count}人 / エラー: {error_count}人\n'
-                f'合計: {len(TARGET_USER_IDS)}人'
-            )
-            
-            # ファイルをアップロード
-            with open(filepath, 'rb') as f:
-                discord_file = discord.File(f, filename)
-                await channel.send(summary_message, file=discord_file)
-            
-            # 一時ファイルを削除
-            os.remove(filepath)
-            print(f'ロール付与処理完了: 成功{success_count}人, エラー{error_count}人')
-            
-        except discord.Forbidden:
-            await channel.send('エラー: ロールを管理する権限がありません。Botに「ロールの管理」権限を与えてください。')
-        except Exception as e:
-            await channel.send(f'ロール付与処理中にエラーが発生しました: {str(e)}')
-            print(f'ロール付与エラー: {e}')
+        await run_role_grant(channel, guild, TARGET_USER_IDS)
+
+@bot.command(name='grant_role')
+@commands.has_permissions(manage_roles=True)
+async def grant_role(ctx):
+    """添付ファイル（テキスト/CSV）に書かれたユーザーIDにロールを付与するコマンド"""
+    if not ctx.guild:
+        await ctx.send('このコマンドはサーバー内でのみ使用できます。')
+        return
+    if not ctx.message.attachments:
+        await ctx.send('ユーザーIDを書いたファイル（テキスト/CSV）を添付してください。')
+        return
+    
+    user_ids = []
+    for attachment in ctx.message.attachments:
+        data = await attachment.read()
+        user_ids.extend(parse_user_ids(data.decode('utf-8', errors='ignore')))
+    
+    if not user_ids:
+        await ctx.send('添付ファイルにユーザーIDが見つかりませんでした。')
+        return
+    
+    await run_role_grant(ctx.channel, ctx.guild, user_ids)
+
+@bot.command(name='grant_role_from')
+@commands.has_permissions(manage_roles=True)
+async def grant_role_from(ctx, source_role: discord.Role):
+    """指定したロールを持つメンバー全員にロールを付与するコマンド（例: !grant_role_from @メンバー）"""
+    user_ids = [member.id for member in source_role.members]
+    if not user_ids:
+        await ctx.send(f'ロール「{source_role.name}」を持つメンバーがいません。')
+        return
+    
+    await run_role_grant(ctx.channel, ctx.guild, user_ids)
+
+@bot.command(name='role_jobs')
+async def role_jobs(ctx):
+    """ロール付与ジョブの一覧を表示するコマンド"""
+    jobs = await asyncio.to_thread(RoleGrantJob.load_all)
+    jobs = [job for job in jobs if ctx.guild and job.guild_id == ctx.guild.id][-ROLE_JOBS_SHOWN:]
+    if not jobs:
+        await ctx.send('ロール付与ジョブはありません。')
+        return
+    
+    lines = []
+    for job in reversed(jobs):
+        engine = active_jobs.get(job.job_id)
+        done = engine.done if engine else len(await asyncio.to_thread(job.load_results))
+        lines.append(f'`{job.job_id}` {job.status} {done:,} / {len(job.user_ids):,}人（{job.created_at}）')
+    await ctx.send('📋 ロール付与ジョブ（新しい順）\n' + '\n'.join(lines))
+
+@bot.command(name='role_job')
+async def role_job(ctx, job_id: str):
+    """ロール付与ジョブの進捗を表示するコマンド"""
+    job = await asyncio.to_thread(RoleGrantJob.load, job_id)
+    if not job or not ctx.guild or job.guild_id != ctx.guild.id:
+        await ctx.send(f'ジョブ `{job_id}` が見つかりません。')
+        return
+    
+    engine = active_jobs.get(job.job_id)
+    if engine:
+        counts = engine.counts
+        done = engine.done
+    else:
+        results = await asyncio.to_thread(job.load_results)
+        counts = dict.fromkeys(RESULT_LABELS, 0)
+        for result in results:
+            counts[result[2]] += 1
+        done = len(results)
+    
+    role = ctx.guild.get_role(job.role_id)
+    status = '実行中' if engine else job.status
+    await ctx.send(
+        f'📊 ロール付与ジョブ `{job.job_id}`（{status}）\n'
+        f'ロール: {role.name if role else job.role_id}\n'
+        f'進捗: {done:,} / {len(job.user_ids):,}人'
+        + (f'（{engine.rate:.1f}人/秒）' if engine else '') + '\n'
+        + ' / '.join(f'{RESULT_LABELS[result]}: {count}人' for result, count in counts.items())
+    )
+
+@bot.command(name='role_job_cancel')
+@commands.has_permissions(manage_roles=True)
+async def role_job_cancel(ctx, job_id: str):
+    """実行中のロール付与ジョブを中止するコマンド（付与済みのロールはそのまま）"""
+    job = await asyncio.to_thread(RoleGrantJob.load, job_id)
+    if not job or not ctx.guild or job.guild_id != ctx.guild.id:
+        await ctx.send(f'ジョブ `{job_id}` が見つかりません。')
+        return
+    if job.status != 'running':
+        await ctx.send(f'ジョブ `{job_id}` は実行中ではありません（{job.status}）。')
+        return
+    
+    engine = active_jobs.get(job.job_id)
+    if engine:
+        # 処理中のユーザーが終わり次第、結果を送信して終了する
+        engine.cancel()
+        await ctx.send(f'ジョブ `{job_id}` を中止しています...')
+    else:
+        await asyncio.to_thread(job.finish, 'cancelled')
+        await ctx.send(f'ジョブ `{job_id}` を中止しました。')
 
 @bot.command(name='role_info')
 async def role_info(ctx):
@@ -1,8 +1,20 @@
 import discord
 from discord.ext import commands
 import os
-import openai
+import asyncio
+import time
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
+from openai_client import OpenAIClient
+from model_router import ModelRoute, ModelRouter
+from response_cache import ResponseCache
+
+# トークン数の計算（tiktoken がインストールされていれば正確に数え、なければ文字数から概算）
+try:
+    import tiktoken
+    TOKEN_ENCODING = tiktoken.get_encoding('o200k_base')
+except ImportError:
+    TOKEN_ENCODING = None
 
 load_dotenv()
 
@@ -10,8 +22,507 @@ TOKEN = os.getenv('DISCORD_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 TARGET_CHANNEL_ID = 1394203406574424104  # ChatGPTが応答する対象チャンネル
 
-# OpenAI クライアントを初期化
-openai.api_key = OPENAI_API_KEY
+# OpenAI クライアント（接続を使い回す共有クライアント）
+openai_client = OpenAIClient(OPENAI_API_KEY)
+
+# 会話の記憶の設定
+MEMORY_PER_USER = True  # True: チャンネル×ユーザーごとに記憶 / False: チャンネル全体で1つの会話として記憶
+MEMORY_MAX_TURNS = 20  # 直近の会話として残すメッセージ数の上限（ユーザー・Botの発言それぞれ1件）
+MEMORY_TOKEN_BUDGET = 1500  # 要約 + 直近の会話に使うトークン数の上限
+MEMORY_COMPACT_RATIO = 0.6  # 上限を超えたら、この割合以下になるまで古い発言を要約に回す
+MEMORY_SUMMARY_MODEL = 'gpt-4.1-mini'  # 要約に使うモデル
+MEMORY_SUMMARY_MAX_TOKENS = 300  # 要約の長さの上限
+MEMORY_IDLE_TIMEOUT = 30 * 60  # この秒数使われなかった会話は破棄
+MEMORY_MAX_CONVERSATIONS = 500  # 記憶する会話数の上限（超えたら最も長く使われていないものを破棄）
+
+def count_tokens(text):
+    """テキストのトークン数"""
+    if TOKEN_ENCODING:
+        return len(TOKEN_ENCODING.encode(text))
+    # 概算: 日本語などは1文字≒1トークン、英数字は4文字≒1トークン
+    ascii_count = sum(1 for char in text if char.isascii())
+    return (len(text) - ascii_count) + ascii_count // 4 + 1
+
+class Conversation:
+    """1つの会話の記憶（古い発言の要約 + 直近の発言のリングバッファ）"""
+    
+    def __init__(self):
+        self.summary = ''
+        self.summary_tokens = 0
+        self.turns = deque()  # 直近の発言 (role, 内容, トークン数)
+        self.turn_tokens = 0
+        # 要約待ち・要約中の発言（要約が終わるまでは会話に含める）
+        self.pending = []
+        self.pending_tokens = 0
+        self.in_summary = []
+        self.summarizing = None  # 要約中のタスク
+        self.last_used = time.monotonic()
+    
+    @property
+    def tokens(self):
+        """会話として送るトークン数"""
+        in_summary_tokens = sum(tokens for _, _, tokens in self.in_summary)
+        return self.summary_tokens + in_summary_tokens + self.pending_tokens + self.turn_tokens
+    
+    def messages(self):
+        """APIに送る会話履歴（古い順）"""
+        return [
+            {'role': role, 'content': content}
+            for role, content, _ in [*self.in_summary, *self.pending, *self.turns]
+        ]
+    
+    def add(self, role, content):
+        """発言を追加し、上限を超えたら古い発言を要約待ちに回す"""
+        tokens = count_tokens(content)
+        self.turns.append((role, content, tokens))
+        self.turn_tokens += tokens
+        
+        if len(self.turns) > MEMORY_MAX_TURNS or self.summary_tokens + self.turn_tokens > MEMORY_TOKEN_BUDGET:
+            target = MEMORY_TOKEN_BUDGET * MEMORY_COMPACT_RATIO
+            while len(self.turns) > 2 and (
+                len(self.turns) > MEMORY_MAX_TURNS * MEMORY_COMPACT_RATIO
+                or self.summary_tokens + self.turn_tokens > target
+            ):
+                turn = self.turns.popleft()
+                self.turn_tokens -= turn[2]
+                self.pending.append(turn)
+                self.pending_tokens += turn[2]
+        
+        # 要約が追いつかない場合は、要約待ちの古い発言から捨てる（会話の大きさを一定以下に保つ）
+        while self.pending_tokens > MEMORY_TOKEN_BUDGET:
+            self.pending_tokens -= self.pending.pop(0)[2]
+
+class ConversationMemory:
+    """会話の記憶を管理するクラス
+    
+    会話ごとに直近の発言だけを残し、溢れた古い発言はバックグラウンドで要約にまとめる
+    （応答を待たせないように、要約は返信を送った後に行う）。
+    一定時間使われなかった会話と、上限を超えた古い会話は破棄する。
+    """
+    
+    def __init__(self, openai_client):
+        self.openai_client = openai_client
+        self.conversations = OrderedDict()  # キー -> Conversation（使われた順）
+        
+        # 統計情報
+        self.summaries = 0
+        self.summary_errors = 0
+        self.evicted = 0
+    
+    def get(self, key):
+        """会話を取得（なければ作成）"""
+        self._evict()
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            conversation = self.conversations[key] = Conversation()
+        self.conversations.move_to_end(key)
+        conversation.last_used = time.monotonic()
+        return conversation
+    
+    def reset(self, key):
+        """会話を忘れる"""
+        return self.conversations.pop(key, None) is not None
+    
+    def _evict(self):
+        """使われていない会話を破棄"""
+        deadline = time.monotonic() - MEMORY_IDLE_TIMEOUT
+        while self.conversations:
+            key, conversation = next(iter(self.conversations.items()))
+            if conversation.last_used > deadline and len(self.conversations) < MEMORY_MAX_CONVERSATIONS:
+                break
+            del self.conversations[key]
+            self.evicted += 1
+    
+    def compact(self, conversation):
+        """要約待ちの発言があれば、バックグラウンドで要約する"""
+        if conversation.pending and (conversation.summarizing is None or conversation.summarizing.done()):
+            conversation.summarizing = asyncio.create_task(self._summarize(conversation))
+    
+    async def _summarize(self, conversation):
+        """要約待ちの発言を、これまでの要約にまとめる"""
+        while conversation.pending:
+            batch = conversation.in_summary = conversation.pending
+            conversation.pending = []
+            conversation.pending_tokens = 0
+            transcript = '\n'.join(
+                f'{"ユーザー" if role == "user" else "アシスタント"}: {content}' for role, content, _ in batch
+            )
+            try:
+                async with self.openai_client.slot('chat') as client:
+                    response = await client.chat.completions.create(
+                        model=MEMORY_SUMMARY_MODEL,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": "あなたは会話の要約係です。これまでの要約とその後の会話を、"
+                                           "ユーザーについての事実・好み・話の流れ・未解決の話題を残して、"
+                                           "簡潔な日本語の要約1つにまとめてください。"
+                            },
+                            {
+                                "role": "user",
+                                "content": f"これまでの要約:\n{conversation.summary or '（なし）'}\n\nその後の会話:\n{transcript}"
+                            }
+                        ],
+                        max_tokens=MEMORY_SUMMARY_MAX_TOKENS,
+                        temperature=0.3,
+                    )
+                conversation.summary = response.choices[0].message.content.strip()
+                conversation.summary_tokens = count_tokens(conversation.summary)
+                self.summaries += 1
+            except Exception as e:
+                # 要約できなかった発言は捨てる（会話が上限を超えて大きくなり続けないように）
+                self.summary_errors += 1
+                print(f'会話の要約エラー: {e}')
+            finally:
+                conversation.in_summary = []
+    
+    def stats(self):
+        """記憶している会話数と要約の回数"""
+        return {
+            'conversations': len(self.conversations),
+            'summaries': self.summaries,
+            'summary_errors': self.summary_errors,
+            'evicted': self.evicted,
+        }
+
+conversation_memory = ConversationMemory(openai_client)
+
+def conversation_key(message):
+    """メッセージが属する会話のキー"""
+    return (message.channel.id, message.author.id if MEMORY_PER_USER else None)
+
+# 応答キャッシュの設定（同じ質問にはAPIを呼ばずに前回の応答を返す）
+RESPONSE_CACHE_SEMANTIC = True  # True: 言い回しの違う同じ質問も埋め込みの類似度で探す / False: 完全一致のみ
+RESPONSE_CACHE_MAX_SIZE = 1000  # キャッシュする応答数の上限
+RESPONSE_CACHE_TTL = 24 * 60 * 60  # 応答をキャッシュする秒数
+
+response_cache = ResponseCache(
+    openai_client if RESPONSE_CACHE_SEMANTIC else None,
+    max_size=RESPONSE_CACHE_MAX_SIZE,
+    ttl=RESPONSE_CACHE_TTL
+)
+
+def is_new_conversation(conversation):
+    """これまでの会話がないか（会話の流れに依存しない質問だけ応答をキャッシュする）"""
+    return not (conversation.summary or conversation.turns or conversation.pending or conversation.in_summary)
+
+# ストリーミング返信の設定
+DISCORD_MESSAGE_LIMIT = 2000  # 1メッセージの文字数上限
+STREAM_EDIT_INTERVAL = 1.2  # 1つの返信を編集する最短の間隔（秒）。届いた分をまとめて編集する
+CHANNEL_EDIT_INTERVAL = 1.1  # 同じチャンネルでメッセージを編集する間隔（秒）。同時に生成中の返信が複数あっても、チャンネル単位の編集のレート制限（5秒に5回）に収まるようにする
+STREAM_CURSOR = ' ▌'  # 生成中であることを示す末尾の表示
+
+class ChannelEditLimiter:
+    """チャンネルごとにメッセージ編集の間隔を空ける（先に待ち始めた編集から順に、interval 秒おきに実行）"""
+    
+    def __init__(self, interval=CHANNEL_EDIT_INTERVAL):
+        self.interval = interval
+        self.next_times = {}  # チャンネルID -> 次に編集できる時刻
+    
+    async def wait(self, channel_id):
+        """このチャンネルで編集できる順番まで待つ"""
+        now = time.monotonic()
+        slot = max(now, self.next_times.get(channel_id, 0.0))
+        self.next_times[channel_id] = slot + self.interval
+        
+        # 使われなくなったチャンネルの記録を削除
+        if len(self.next_times) > 1000:
+            for old_channel_id in [key for key, next_time in self.next_times.items() if next_time < now]:
+                del self.next_times[old_channel_id]
+        
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+channel_edit_limiter = ChannelEditLimiter()
+
+def split_position(text):
+    """メッセージを分割する位置（後半にある改行 → 句読点・空白の順に探し、なければ末尾）"""
+    for separators in ('\n', '。！？.!? '):
+        position = max(text.rfind(separator) for separator in separators)
+        if position >= len(text) // 2:
+            return position + 1
+    return len(text)
+
+class StreamingReply:
+    """生成中の応答で返信を少しずつ更新するクラス
+    
+    最初の文字が届いた時点で返信し、以降は STREAM_EDIT_INTERVAL 秒ごとに届いた分をまとめて編集する。
+    編集は同じチャンネルの他の返信と合わせて channel_edit_limiter で間隔を空ける。
+    2000文字を超えたら、そこまでのメッセージを確定させて続きを新しいメッセージに書く。
+    編集はバックグラウンドで行うので、応答の受信は編集を待たない。
+    """
+    
+    def __init__(self, message):
+        self.message = message
+        self.text = ''  # 受け取った応答の全文
+        self.offset = 0  # 確定済みのメッセージに書いた文字数
+        self.current = None  # 編集中のメッセージ
+        self.shown = ''  # 編集中のメッセージの内容
+        self.sent_messages = 0
+        self.changed = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+    
+    def feed(self, delta):
+        """生成された文字列を追加"""
+        if not self.text:
+            delta = delta.lstrip()
+        if delta:
+            self.text += delta
+            self.changed.set()
+    
+    async def finish(self):
+        """最後の内容で返信を確定し、応答の全文を返す"""
+        self.finished.set()
+        self.changed.set()
+        await self.task
+        return self.text.strip()
+    
+    async def _run(self):
+        """届いた分を一定間隔でまとめて返信に反映"""
+        while not self.finished.is_set():
+            await self.changed.wait()
+            self.changed.clear()
+            if self.finished.is_set():
+                break
+            await self._flush()
+            # 次の編集まで待つ（応答が終わったらすぐに最後の編集をする）
+            try:
+                await asyncio.wait_for(self.finished.wait(), STREAM_EDIT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        await self._flush(final=True)
+    
+    async def _flush(self, final=False):
+        """受け取った内容を返信に反映"""
+        limit = DISCORD_MESSAGE_LIMIT - len(STREAM_CURSOR)
+        
+        # 上限を超えた分は、区切りのよい位置でメッセージを確定して次のメッセージに回す
+        while len(self.text) - self.offset > limit:
+            chunk = self.text[self.offset:self.offset + limit]
+            position = split_position(chunk)
+            await self._show(chunk[:position].rstrip())
+            self.current = None
+            self.shown = ''
+            self.offset += position
+            while self.offset < len(self.text) and self.text[self.offset].isspace():
+                self.offset += 1
+        
+        content = self.text[self.offset:].rstrip()
+        if content:
+            await self._show(content if final else content + STREAM_CURSOR)
+    
+    async def _show(self, content):
+        """編集中のメッセージを content にする（まだなければ送信）"""
+        if not content or content == self.shown:
+            return
+        if self.current is None:
+            if self.sent_messages == 0:
+                self.current = await self.message.reply(content)
+            else:
+                self.current = await self.message.channel.send(content)
+            self.sent_messages += 1
+        else:
+            await channel_edit_limiter.wait(self.message.channel.id)
+            await self.current.edit(content=content)
+        self.shown = content
+
+# 連投のまとめ・レート制限の設定
+COALESCE_WINDOW = 1.5  # 同じユーザーの連投をまとめる待ち時間（秒）。最後の投稿からこの秒数、次の投稿がなければ処理する
+COALESCE_MAX_WAIT = 5.0  # 連投が続いても、最初の投稿からこの秒数で処理する
+COALESCE_MAX_MESSAGES = 5  # 1回の問い合わせにまとめる投稿数の上限
+CHAT_WORKERS = 4  # 同時に処理する問い合わせ数（残りの枠は会話の要約などに使う）
+CHAT_GLOBAL_RATE = 30 / 60  # チャンネル全体の問い合わせ数の上限（回/秒）
+CHAT_GLOBAL_BURST = 10  # チャンネル全体で連続して処理できる問い合わせ数
+CHAT_USER_RATE = 4 / 60  # ユーザーごとの問い合わせ数の上限（回/秒）
+CHAT_USER_BURST = 3  # ユーザーごとに連続して処理できる問い合わせ数
+CHAT_MAX_QUEUED_PER_USER = 10  # ユーザーごとに待たせておける投稿数（超えた投稿は受け付けない）
+WAITING_EMOJI = '⏳'  # レート制限などで待たせている投稿に付けるリアクション
+REJECTED_EMOJI = '🚫'  # 受け付けなかった投稿に付けるリアクション
+
+class TokenBucket:
+    """トークンバケット（毎秒 rate 個ずつ、最大 capacity 個まで補充）"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def wait_time(self, now):
+        """次のトークンが使えるまでの秒数（すぐ使えるなら0）"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now):
+        """トークンを1つ使う"""
+        self._refill(now)
+        self.tokens -= 1
+    
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class ChatBatch:
+    """1回の問い合わせにまとめる、同じユーザーの連投"""
+    
+    def __init__(self, message, now):
+        self.messages = [message]
+        self.created = now
+        self.updated = now
+        self.waiting_message = None  # 待機中のリアクションを付けた投稿
+    
+    def add(self, message, now):
+        self.messages.append(message)
+        self.updated = now
+    
+    @property
+    def due(self):
+        """処理を始めてよい時刻（連投が途切れたか、待ち時間の上限に達したとき）"""
+        return min(self.updated + COALESCE_WINDOW, self.created + COALESCE_MAX_WAIT)
+
+class ChatScheduler:
+    """ChatGPTへの問い合わせの順番を管理するクラス
+    
+    同じユーザーの連投は1回の問い合わせにまとめ、チャンネル全体とユーザーごとのトークンバケットで回数を制限する。
+    待っているユーザーから順番に1件ずつ処理し（ラウンドロビン）、連投の多いユーザーが他のユーザーを待たせないようにする。
+    同じユーザーの問い合わせは、会話の順序を保つために1件ずつ処理する。
+    """
+    
+    def __init__(self, handler, workers=CHAT_WORKERS):
+        self.handler = handler  # async def handler(messages)
+        self.workers = workers
+        self.pending = {}  # (チャンネルID, ユーザーID) -> 待機中の ChatBatch の deque
+        self.order = deque()  # 待機中のユーザー（処理を始めたユーザーは最後尾に回す）
+        self.running = set()  # 処理中のユーザー
+        self.global_bucket = TokenBucket(CHAT_GLOBAL_RATE, CHAT_GLOBAL_BURST)
+        self.user_buckets = {}  # ユーザーID -> TokenBucket
+        self.wakeup = asyncio.Event()
+        self.task = None
+        
+        # 統計情報
+        self.started = 0
+        self.coalesced = 0  # 前の投稿とまとめた投稿数
+        self.throttled = 0  # レート制限・同時実行数の上限で待たせた問い合わせ数
+        self.rejected = 0
+    
+    def submit(self, message):
+        """投稿を受け付ける（待たせている投稿が多すぎる場合は False）"""
+        key = (message.channel.id, message.author.id)
+        batches = self.pending.setdefault(key, deque())
+        now = time.monotonic()
+        if batches and len(batches[-1].messages) < COALESCE_MAX_MESSAGES:
+            batches[-1].add(message, now)
+            self.coalesced += 1
+        elif sum(len(batch.messages) for batch in batches) >= CHAT_MAX_QUEUED_PER_USER:
+            self.rejected += 1
+            return False
+        else:
+            batches.append(ChatBatch(message, now))
+        
+        if key not in self.order:
+            self.order.append(key)
+        if self.task is None:
+            self.task = asyncio.create_task(self._dispatch())
+        self.wakeup.set()
+        return True
+    
+    async def _dispatch(self):
+        """処理を始められる問い合わせを開始し、次に始められる時刻まで待つ"""
+        while True:
+            self.wakeup.clear()
+            delay = self._start_ready(time.monotonic())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _start_ready(self, now):
+        """待機中のユーザーを順に見て処理を始める。戻り値は次に確認するまでの秒数（None なら次の投稿・完了まで待つ）"""
+        delay = None
+        for key in list(self.order):
+            if key in self.running:
+                continue
+            batch = self.pending[key][0]
+            if batch.due > now:
+                delay = batch.due - now if delay is None else min(delay, batch.due - now)
+                continue
+            
+            if len(self.running) >= self.workers:
+                # 処理中の問い合わせが終わったら再確認する
+                self._mark_waiting(batch)
+                continue
+            user_bucket = self.user_buckets.setdefault(key[1], TokenBucket(CHAT_USER_RATE, CHAT_USER_BURST))
+            wait = max(user_bucket.wait_time(now), self.global_bucket.wait_time(now))
+            if wait > 0:
+                self._mark_waiting(batch)
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            
+            user_bucket.take(now)
+            self.global_bucket.take(now)
+            self._start(key, now)
+        
+        # 使われなくなったユーザーのバケットを削除（満タンなら作り直しても同じ）
+        if len(self.user_buckets) > 1000:
+            active = {key[1] for key in self.pending}
+            for user_id in [user_id for user_id, bucket in self.user_buckets.items() if user_id not in active and bucket.is_full(now)]:
+                del self.user_buckets[user_id]
+        return delay
+    
+    def _start(self, key, now):
+        """ユーザーの先頭の問い合わせを開始"""
+        batches = self.pending[key]
+        batch = batches.popleft()
+        self.order.remove(key)
+        if batches:
+            self.order.append(key)
+        else:
+            del self.pending[key]
+        
+        if batch.waiting_message:
+            asyncio.create_task(self._react(batch.waiting_message.remove_reaction(WAITING_EMOJI, bot.user)))
+        
+        self.running.add(key)
+        self.started += 1
+        task = asyncio.create_task(self.handler(batch.messages))
+        task.add_done_callback(lambda task: self._finished(key, task))
+    
+    def _finished(self, key, task):
+        self.running.discard(key)
+        self.wakeup.set()
+        if not task.cancelled() and task.exception():
+            print(f'ChatGPT 応答処理のエラー: {task.exception()}')
+    
+    def _mark_waiting(self, batch):
+        """待たせている問い合わせの最後の投稿にリアクションを付ける（1回だけ）"""
+        if batch.waiting_message is None:
+            self.throttled += 1
+            batch.waiting_message = batch.messages[-1]
+            asyncio.create_task(self._react(batch.waiting_message.add_reaction(WAITING_EMOJI)))
+    
+    async def _react(self, coroutine):
+        """リアクションの追加・削除（失敗しても処理は続ける）"""
+        try:
+            await coroutine
+        except discord.HTTPException as e:
+            print(f'リアクションの更新エラー: {e}')
+    
+    def stats(self):
+        """待機中・処理中の問い合わせ数と、まとめた・待たせた・受け付けなかった投稿数"""
+        return {
+            'queued': sum(len(batches) for batches in self.pending.values()),
+            'running': len(self.running),
+            'started': self.started,
+            'coalesced': self.coalesced,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+        }
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -30,85 +541,129 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # 対象チャンネルでのメッセージのみ処理
-    if message.channel.id == TARGET_CHANNEL_ID:
-        # "thinking..." リアクションを追加
-        await message.add_reaction('🤔')
-        
-        try:
-            # ChatGPTに送信するメッセージを準備
-            user_message = message.content
-            
-            # OpenAI API呼び出し
-            response = await get_chatgpt_response(user_message, message.author.display_name)
-            
-            # レスポンスが長すぎる場合は分割
-            if len(response) > 2000:
-                # Discordの2000文字制限に対応
-                chunks = [response[i:i+1900] for i in range(0, len(response), 1900)]
-                for i, chunk in enumerate(chunks):
-                    if i == 0:
-                        await message.reply(chunk)
-                    else:
-                        await message.channel.send(chunk)
-            else:
-                await message.reply(response)
-            
-            # "thinking..." リアクションを削除して完了リアクション追加
-            await message.remove_reaction('🤔', bot.user)
-            await message.add_reaction('✅')
-            
-        except Exception as e:
-            await message.reply(f'エラーが発生しました: {str(e)}')
-            await message.remove_reaction('🤔', bot.user)
-            await message.add_reaction('❌')
-            print(f'ChatGPT API エラー: {e}')
+    # 対象チャンネルでのメッセージのみ処理（連投はまとめて、順番に応答する）
+    if message.channel.id == TARGET_CHANNEL_ID and not message.content.startswith(bot.command_prefix):
+        if not chat_scheduler.submit(message):
+            await message.add_reaction(REJECTED_EMOJI)
     
     # コマンド処理
     await bot.process_commands(message)
 
-async def get_chatgpt_response(user_message, username):
-    """ChatGPT APIを呼び出して応答を取得"""
+async def respond_to_messages(messages):
+    """同じユーザーの連投をまとめてChatGPTに送り、最後の投稿に返信する
+    
+    返信そのものが生成中の表示になるので、処理中・完了のリアクションは付けない（失敗時のみ❌）。
+    """
+    message = messages[-1]
     try:
-        # 最新のOpenAI API形式（responses.create）
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        # ChatGPTに送信するメッセージを準備
+        user_message = '\n'.join(m.content for m in messages)
         
-        # システムプロンプトとユーザーメッセージを組み合わせて入力を作成
-        system_prompt = f"あなたは元気いっぱいの男の子の少年です！{username}さんと楽しくお話しするのが大好きです。明るく元気で好奇心旺盛な少年として、日本語で楽しく会話してください。「だよ！」「すごいね！」「わーい！」などの元気な言葉遣いを使って、簡潔で分かりやすい回答をしてください。"
-        combined_input = f"{system_prompt}\n\nユーザー: {user_message}"
+        # OpenAI API呼び出し（これまでの会話の要約と直近の発言も送る）
+        # 生成された分から返信し、2000文字を超えたら続きを新しいメッセージに書く
+        conversation = conversation_memory.get(conversation_key(message))
+        username = message.author.display_name
         
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=combined_input
-        )
+        # 会話の最初の質問なら、同じ質問への応答がキャッシュにあればそれを返す
+        use_cache = is_new_conversation(conversation)
+        cached = await response_cache.get(user_message) if use_cache else None
+        
+        reply = StreamingReply(message)
+        try:
+            if cached is not None:
+                reply.feed(cached)
+            else:
+                async for delta in stream_chatgpt_response(user_message, username, conversation):
+                    reply.feed(delta)
+        finally:
+            # 途中で失敗した場合も、そこまでの内容は返信に残す
+            response = await reply.finish()
+        
+        if not response:
+            await message.reply('（応答が空でした）')
+            return
+        
+        # 会話を記憶し、上限を超えた古い発言は返信後にバックグラウンドで要約する
+        conversation.add('user', user_message)
+        conversation.add('assistant', response)
+        conversation_memory.compact(conversation)
         
-        return response.output_text.strip()
+        # 応答をキャッシュ（質問者の名前を含む応答は他の人に返せないのでキャッシュしない）
+        if use_cache and cached is None and username not in response:
+            await response_cache.put(user_message, response)
         
     except Exception as e:
-        # フォールバック: 従来のchat.completions.create形式（gpt-4使用）
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": f"あなたは元気いっぱいの男の子の少年です！{username}さんと楽しくお話しするのが大好きです。明るく元気で好奇心旺盛な少年として、日本語で楽しく会話してください。「だよ！」「すごいね！」「わーい！」などの元気な言葉遣いを使って、簡潔で分かりやすい回答をしてください。"
-                    },
-                    {
-                        "role": "user", 
-                        "content": user_message
-                    }
-                ],
-                max_tokens=500,
-                temperature=0.7,
-            )
-            
-            return response.choices[0].message.content.strip()
-            
-        except Exception as fallback_error:
-            print(f'OpenAI APIエラー (フォールバック): {fallback_error}')
-            raise Exception(f"ChatGPT API呼び出しに失敗しました: {str(e)}")
+        await message.reply(f'エラーが発生しました: {str(e)}')
+        await message.add_reaction('❌')
+        print(f'ChatGPT API エラー: {e}')
+
+chat_scheduler = ChatScheduler(respond_to_messages)
+
+async def get_chatgpt_response(user_message, username, conversation=None):
+    """ChatGPT APIを呼び出して応答の全文を取得"""
+    chunks = []
+    async for delta in stream_chatgpt_response(user_message, username, conversation):
+        chunks.append(delta)
+    return ''.join(chunks).strip()
+
+async def stream_chatgpt_response(user_message, username, conversation=None):
+    """ChatGPT APIを呼び出して、生成された文字列を順に返す（conversation を指定すると会話の記憶も送る）"""
+    system_prompt = f"あなたは元気いっぱいの男の子の少年です！{username}さんと楽しくお話しするのが大好きです。明るく元気で好奇心旺盛な少年として、日本語で楽しく会話してください。「だよ！」「すごいね！」「わーい！」などの元気な言葉遣いを使って、簡潔で分かりやすい回答をしてください。"
+    history = []
+    if conversation:
+        if conversation.summary:
+            system_prompt += f"\n\nこれまでの会話の要約:\n{conversation.summary}"
+        history = conversation.messages()
+    
+    # 使えるモデルに順に送る（失敗が続くモデルは一時停止し、応答開始が遅ければ次のモデルにも送る）
+    request = {'system_prompt': system_prompt, 'history': history, 'user_message': user_message}
+    async for delta in model_router.stream(request):
+        yield delta
+
+async def stream_with_responses(model, request):
+    """最新のOpenAI API形式（responses.create）で生成された文字列を順に返す"""
+    # システムプロンプトを指示として、これまでの会話とユーザーメッセージを入力にする
+    async with openai_client.slot('chat') as client:
+        stream = await client.responses.create(
+            model=model,
+            instructions=request['system_prompt'],
+            input=[*request['history'], {"role": "user", "content": request['user_message']}],
+            stream=True
+        )
+        async for event in stream:
+            if event.type == 'response.output_text.delta':
+                yield event.delta
+
+async def stream_with_chat_completions(model, request):
+    """従来のchat.completions.create形式で生成された文字列を順に返す"""
+    async with openai_client.slot('chat') as client:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system", 
+                    "content": request['system_prompt']
+                },
+                *request['history'],
+                {
+                    "role": "user", 
+                    "content": request['user_message']
+                }
+            ],
+            max_tokens=500,
+            temperature=0.7,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+# 応答に使うモデル（優先する順。メイン: gpt-4.1、フォールバック: gpt-4）
+CHAT_HEDGE = True  # True: メインモデルの応答開始が普段より遅いときはフォールバックにも同時に送る
+model_router = ModelRouter([
+    ModelRoute('gpt-4.1', stream_with_responses),
+    ModelRoute('gpt-4', stream_with_chat_completions),
+], hedge=CHAT_HEDGE)
 
 @bot.command(name='chatgpt_test')
 async def chatgpt_test(ctx, *, message):
@@ -123,6 +678,18 @@ async def chatgpt_test(ctx, *, message):
     except Exception as e:
         await ctx.send(f'テスト中にエラーが発生しました: {str(e)}')
 
+@bot.command(name='chatgpt_reset')
+async def chatgpt_reset(ctx):
+    """自分との会話の記憶を消去"""
+    if ctx.channel.id != TARGET_CHANNEL_ID:
+        await ctx.send('このコマンドは指定されたチャンネルでのみ使用できます。')
+        return
+    
+    if conversation_memory.reset(conversation_key(ctx.message)):
+        await ctx.send('🧹 会話の記憶を消去しました。')
+    else:
+        await ctx.send('記憶している会話はありません。')
+
 @bot.command(name='chatgpt_status')
 async def chatgpt_status(ctx):
     """ChatGPTの設定状況を確認"""
@@ -130,13 +697,31 @@ async def chatgpt_status(ctx):
         await ctx.send('このコマンドは指定されたチャンネルでのみ使用できます。')
         return
     
+    chat_stats = openai_client.stats()['chat']
+    memory_stats = conversation_memory.stats()
+    cache_stats = response_cache.stats()
+    scheduler_stats = chat_scheduler.stats()
+    
+    # モデルごとの状態と応答開始までの時間
+    state_labels = {'closed': '🟢 正常', 'open': '🔴 一時停止', 'half_open': '🟡 確認中'}
+    model_lines = '\n'.join(
+        f'・{model}: {state_labels[stats["state"]]} / 累計 {stats["requests"]}（失敗 {stats["failures"]}、ヘッジ {stats["hedges"]}、取消 {stats["cancelled"]}）'
+        + (f' / 応答開始 p50 {stats["p50"]:.2f}秒・p95 {stats["p95"]:.2f}秒' if stats['p50'] is not None else '')
+        for model, stats in model_router.stats().items()
+    )
+    conversation = conversation_memory.conversations.get(conversation_key(ctx.message))
     status_message = (
         f'🤖 ChatGPT Discord Bot 設定状況\n'
         f'対象チャンネル: {TARGET_CHANNEL_ID}\n'
         f'OpenAI API設定: {"✅ 設定済み" if OPENAI_API_KEY else "❌ 未設定"}\n'
-        f'メインモデル: gpt-4.1 (最新)\n'
-        f'フォールバックモデル: gpt-4\n'
-        f'API形式: responses.create (最新)'
+        f'モデル（優先順）:\n{model_lines}\n'
+        f'API呼び出し: 実行中 {chat_stats["in_flight"]} / 待機中 {chat_stats["waiting"]} / 累計 {chat_stats["requests"]}（エラー {chat_stats["errors"]}）\n'
+        f'問い合わせ: 処理中 {scheduler_stats["running"]} / 待機中 {scheduler_stats["queued"]}'
+        f'（連投のまとめ {scheduler_stats["coalesced"]}件、制限で待機 {scheduler_stats["throttled"]}件、受付拒否 {scheduler_stats["rejected"]}件）\n'
+        f'会話の記憶: {memory_stats["conversations"]}件（要約 {memory_stats["summaries"]}回、破棄 {memory_stats["evicted"]}件）\n'
+        f'応答キャッシュ: {cache_stats["cached"]}件 / ヒット率 {cache_stats["hit_rate"]:.1%}'
+        f'（完全一致 {cache_stats["exact_hits"]}、類似 {cache_stats["semantic_hits"]}、ミス {cache_stats["misses"]}）\n'
+        f'あなたの会話: {conversation.tokens if conversation else 0} / {MEMORY_TOKEN_BUDGET}トークン'
     )
     
     await ctx.send(status_message)
@@ -4,13 +4,15 @@ import os
 from dotenv import load_dotenv
 import openai
 from datetime import datetime
+from openai_client import OpenAIClient
 
 load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-openai.api_key = OPENAI_API_KEY
+# OpenAI クライアント（接続を使い回す共有クライアント）
+openai_client = OpenAIClient(OPENAI_API_KEY)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -71,7 +73,6 @@ async def on_raw_reaction_add(payload):
 
 async def process_audio_file(channel, attachment):
     processing_msg = None
-    temp_filename = None
     output_filename = None
     
     try:
@@ -86,19 +87,13 @@ async def process_audio_file(channel, attachment):
         # 音声ファイルをダウンロード
         audio_data = await attachment.read()
         
-        # 一時ファイルに保存
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        temp_filename = f"/tmp/{timestamp}_{attachment.filename}"
-        with open(temp_filename, 'wb') as f:
-            f.write(audio_data)
         
-        # OpenAI Audio APIで文字起こし
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        
-        with open(temp_filename, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
+        # OpenAI Audio APIで文字起こし（一時ファイルに保存せず、ダウンロードしたデータをそのまま送信）
+        async with openai_client.slot('audio') as client:
+            transcript = await client.audio.transcriptions.create(
                 model="whisper-1",
-                file=audio_file,
+                file=(attachment.filename, audio_data),
                 language="ja"  # 日本語を指定
             )
         
@@ -146,12 +141,6 @@ async def process_audio_file(channel, attachment):
         print(f"文字起こしエラー: {e}")
     finally:
         # 一時ファイルのクリーンアップ
-        try:
-            if temp_filename and os.path.exists(temp_filename):
-                os.remove(temp_filename)
-        except Exception as e:
-            print(f"一時ファイル削除エラー: {e}")
-        
         try:
             if output_filename and os.path.exists(output_filename):
                 os.remove(output_filename)
@@ -5,13 +5,15 @@ from dotenv import load_dotenv
 import openai
 import base64
 from datetime import datetime
+from openai_client import OpenAIClient
 
 load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-openai.api_key = OPENAI_API_KEY
+# OpenAI クライアント（接続を使い回す共有クライアント）
+openai_client = OpenAIClient(OPENAI_API_KEY)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -90,30 +92,29 @@ async def process_image_file(channel, attachment):
         image_base64 = base64.b64encode(image_data).decode('utf-8')
         
         # OpenAI Vision APIで画像の文字起こし
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "この画像に含まれている文字をすべて読み取って、正確にテキストとして出力してください。画像に文字が含まれていない場合は「この画像には文字が含まれていません」と回答してください。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}",
-                                "detail": "high"
+        async with openai_client.slot('image') as client:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": "この画像に含まれている文字をすべて読み取って、正確にテキストとして出力してください。画像に文字が含まれていない場合は「この画像には文字が含まれていません」と回答してください。"
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:image/jpeg;base64,{image_base64}",
+                                    "detail": "high"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=2000
-        )
+                        ]
+                    }
+                ],
+                max_tokens=2000
+            )
         
         # 文字起こし結果を取得
         ocr_text = response.choices[0].message.content
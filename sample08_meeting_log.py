@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 import openai
 from datetime import datetime
 import tempfile
+from openai_client import OpenAIClient
 
 load_dotenv()
 
@@ -22,6 +23,9 @@ intents.reactions = True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# OpenAI クライアント（接続を使い回す共有クライアント）
+openai_client = OpenAIClient(OPENAI_API_KEY)
+
 # 文字起こし結果を保存するための辞書
 transcription_files = {}
 
@@ -84,7 +88,6 @@ async def handle_transcription_request(channel, message):
 async def process_audio_file(channel, attachment):
     """音声ファイルを文字起こしする"""
     processing_msg = None
-    temp_filename = None
     
     try:
         # ファイルサイズチェック (OpenAI APIの制限: 25MB)
@@ -98,19 +101,13 @@ async def process_audio_file(channel, attachment):
         # 音声ファイルをダウンロード
         audio_data = await attachment.read()
         
-        # 一時ファイルに保存
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{attachment.filename}") as temp_file:
-            temp_filename = temp_file.name
-            temp_file.write(audio_data)
-        
-        # OpenAI Audio APIで文字起こし
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
         
-        with open(temp_filename, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
+        # OpenAI Audio APIで文字起こし（一時ファイルに保存せず、ダウンロードしたデータをそのまま送信）
+        async with openai_client.slot('audio') as client:
+            transcript = await client.audio.transcriptions.create(
                 model="whisper-1",
-                file=audio_file,
+                file=(attachment.filename, audio_data),
                 language="ja"  # 日本語を指定
             )
         
@@ -177,13 +174,6 @@ async def process_audio_file(channel, attachment):
         await channel.send(error_msg)
         print(f"文字起こしエラー: {e}")
     finally:
-        # 一時ファイルのクリーンアップ
-        try:
-            if temp_filename and os.path.exists(temp_filename):
-                os.remove(temp_filename)
-        except Exception as e:
-            print(f"一時ファイル削除エラー: {e}")
-        
         # 処理開始メッセージが残っている場合は削除
         try:
             if processing_msg:
@@ -246,8 +236,6 @@ async def generate_meeting_log(channel, transcription_text, original_filename, t
         processing_msg = await channel.send(f"📝 {original_filename} の議事録を生成中...")
         
         # ChatGPT APIで議事録を生成
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        
         system_prompt = """あなたは議事録作成の専門家です。音声文字起こしの内容を元に、構造化された議事録を作成してください。
 
 以下の形式で議事録を作成してください：
@@ -300,15 +288,16 @@ async def generate_meeting_log(channel, transcription_text, original_filename, t
 - 重要な発言や決定事項は漏らさないようにしてください
 """
 
-        response = client.chat.completions.create(
-            model="gpt-4.1",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"以下の文字起こし内容を議事録に変換してください：\n\n{transcription_text}"}
-            ],
-            max_tokens=2000,
-            temperature=0.3
-        )
+        async with openai_client.slot('chat') as client:
+            response = await client.chat.completions.create(
+                model="gpt-4.1",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"以下の文字起こし内容を議事録に変換してください：\n\n{transcription_text}"}
+                ],
+                max_tokens=2000,
+                temperature=0.3
+            )
         
         meeting_log = response.choices[0].message.content.strip()
         
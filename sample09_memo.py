@@ -4,6 +4,7 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from member_cache import MemberResolver
 
 load_dotenv()
 
@@ -19,6 +20,9 @@ intents.reactions = True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# メンバー取得キャッシュ
+member_resolver = MemberResolver()
+
 @bot.event
 async def on_ready():
     print(f'{bot.user} が起動しました！')
@@ -59,9 +63,12 @@ async def on_raw_reaction_add(payload):
         user = None
         guild = bot.get_guild(payload.guild_id)
         
-        # ギルドメンバーから取得を試行
+        # ギルドメンバーから取得を試行（キャッシュ優先、見つからない場合のみAPIから取得）
         if guild:
-            user = guild.get_member(payload.user_id)
+            try:
+                user = await member_resolver.resolve(guild, payload.user_id)
+            except discord.HTTPException:
+                pass
         
         # キャッシュから取得を試行
         if not user:
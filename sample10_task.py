@@ -3,8 +3,11 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
+import asyncio
+import time
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 load_dotenv()
 
@@ -23,6 +26,12 @@ DB_CONFIG = {
 # 対象のギルドID
 TARGET_GUILD_ID = 1394139562028306644
 
+# タスク一覧の1ページあたりの表示件数（セレクトメニューの上限は25件）
+TASKS_PER_PAGE = 10
+
+# 未完了タスク数の統計情報がこの件数未満（または未集計）なら、この件数を上限に実際に数える
+EXACT_COUNT_LIMIT = 10000
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
@@ -30,88 +39,206 @@ intents.reactions = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 class TaskManager:
-    """タスク管理クラス"""
+    """タスク管理クラス（コネクションプール版）
+
+    psycopg2 のブロッキング呼び出しはワーカースレッドで実行し、
+    イベントループ（ハートビートや他のリアクション処理）を止めないようにする。
+    """
     
-    def __init__(self, config):
+    def __init__(self, config, min_size=1, max_size=5, timeout=10.0, health_check_interval=60.0):
         self.config = config
-        self.connection = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout  # 1回のDB呼び出しあたりのタイムアウト（秒）
+        self.health_check_interval = health_check_interval  # この秒数以上使われていない接続は疎通確認する
+        self.pool = None
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._connect_lock = asyncio.Lock()
+        self._last_used = {}
     
-    def connect(self):
-        """データベースに接続"""
-        try:
-            self.connection = psycopg2.connect(**self.config)
-            print(f"Supabase PostgreSQLに接続しました: {self.config['host']}")
-            return True
-        except psycopg2.Error as e:
-            print(f"データベース接続エラー: {e}")
-            return False
+    async def connect(self):
+        """コネクションプールを作成"""
+        async with self._connect_lock:
+            if self.pool and not self.pool.closed:
+                return True
+            
+            try:
+                self.pool = await asyncio.to_thread(
+                    ThreadedConnectionPool,
+                    self.min_size,
+                    self.max_size,
+                    connect_timeout=int(self.timeout),
+                    # サーバー側でも長時間のクエリを打ち切る
+                    options=f"-c statement_timeout={int(self.timeout * 1000)}",
+                    **self.config
+                )
+                print(f"Supabase PostgreSQLに接続しました: {self.config['host']} (プール: {self.min_size}-{self.max_size})")
+                return True
+            except psycopg2.Error as e:
+                print(f"データベース接続エラー: {e}")
+                return False
     
     def disconnect(self):
-        """データベース接続を切断"""
-        if self.connection and not self.connection.closed:
-            self.connection.close()
+        """コネクションプールを閉じる"""
+        if self.pool and not self.pool.closed:
+            self.pool.closeall()
+            self._last_used.clear()
             print("データベース接続を切断しました")
     
-    def create_task(self, title):
+    def _checkout(self):
+        """プールから健全な接続を取り出す（スレッド内で実行）"""
+        conn = self.pool.getconn()
+        last_used = self._last_used.get(id(conn), 0)
+        
+        try:
+            if not conn.closed and time.monotonic() - last_used > self.health_check_interval:
+                # しばらく使われていない接続は疎通確認
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+        
+        if conn.closed:
+            # 切断済みの接続は破棄して再接続
+            self.pool.putconn(conn, close=True)
+            conn = self.pool.getconn()
+        return conn
+    
+    def _execute(self, func, *args):
+        """接続を借りて func(conn, *args) を実行（スレッド内で実行）"""
+        conn = self._checkout()
+        try:
+            return func(conn, *args)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # 接続が壊れている可能性があるので、この接続は破棄する
+            self._last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=True)
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                if not conn.closed:
+                    conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn, close=conn.closed)
+    
+    async def _run(self, func, *args):
+        """DB処理をワーカースレッドで実行し、完了を待つ"""
+        if not self.pool or self.pool.closed:
+            # 接続に失敗していた場合などは次の呼び出し時に再接続する
+            if not await self.connect():
+                raise psycopg2.InterfaceError("データベースに接続できません")
+        
+        # タイムアウトしてもスレッドは止まらず接続を使い続けるので、
+        # 枠はスレッドが終わるまで返さない（プールの上限を超えて getconn しないように）
+        await self._semaphore.acquire()
+        future = asyncio.ensure_future(asyncio.to_thread(self._execute, func, *args))
+        future.add_done_callback(self._release)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+    
+    def _release(self, future):
+        """スレッドの終了時に同時実行数の枠を返す"""
+        self._semaphore.release()
+        if not future.cancelled():
+            future.exception()  # タイムアウト後に終わったスレッドの例外は呼び出し側に届かないので、ここで回収する
+    
+    async def create_task(self, title):
         """新しいタスクを作成"""
-        if not self.connection or self.connection.closed:
-            return None
+        def query(conn, title):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO tasks (title, completed) VALUES (%s, %s) RETURNING id",
+                    (title, False)
+                )
+                task_id = cursor.fetchone()[0]
+            conn.commit()
+            return task_id
         
         try:
-            cursor = self.connection.cursor()
-            query = "INSERT INTO tasks (title, completed) VALUES (%s, %s) RETURNING id"
-            cursor.execute(query, (title, False))
-            task_id = cursor.fetchone()[0]
-            self.connection.commit()
-            cursor.close()
+            task_id = await self._run(query, title)
             print(f"タスクを作成しました: ID={task_id}, タイトル={title}")
             return task_id
-        except psycopg2.Error as e:
-            print(f"タスク作成エラー: {e}")
+        except (psycopg2.Error, asyncio.TimeoutError) as e:
+            print(f"タスク作成エラー: {e!r}")
             return None
     
-    def get_incomplete_tasks(self):
-        """未完了のタスクのみを取得"""
-        if not self.connection or self.connection.closed:
-            return []
+    async def get_incomplete_tasks_page(self, after_id=0, limit=TASKS_PER_PAGE):
+        """未完了タスクを1ページ分取得（キーセットページネーション）
+        
+        after_id より大きいIDのタスクを最大 limit 件返す。OFFSET を使わないため、
+        テーブルが大きくなっても部分インデックス idx_tasks_incomplete の範囲走査だけで済む。
+        戻り値は (タスクのリスト, 次のページがあるか)。
+        """
+        def query(conn, after_id, limit):
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    "SELECT id, title, completed FROM tasks "
+                    "WHERE completed = FALSE AND id > %s ORDER BY id ASC LIMIT %s",
+                    (after_id, limit + 1)
+                )
+                return cursor.fetchall()
+        
+        try:
+            tasks = await self._run(query, after_id, limit)
+        except (psycopg2.Error, asyncio.TimeoutError) as e:
+            print(f"タスク取得エラー: {e!r}")
+            return [], False
+        
+        # 1件多く取得して次のページの有無を判定
+        return tasks[:limit], len(tasks) > limit
+    
+    async def estimate_incomplete_task_count(self):
+        """未完了タスク数の概算を取得
+        
+        部分インデックスの統計情報（pg_class.reltuples）を使うので件数によらず一定時間で返る。
+        reltuples はインデックス作成時の値のまま ANALYZE（autovacuum）まで更新されないため、
+        未集計（0以下）や EXACT_COUNT_LIMIT 件未満のときは、EXACT_COUNT_LIMIT 件を上限に実際に数える。
+        """
+        def query(conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'idx_tasks_incomplete'::regclass")
+                result = cursor.fetchone()
+                estimate = result[0] if result else 0
+                if estimate >= EXACT_COUNT_LIMIT:
+                    return estimate
+                cursor.execute(
+                    "SELECT COUNT(*) FROM (SELECT 1 FROM tasks WHERE completed = FALSE LIMIT %s) AS incomplete",
+                    (EXACT_COUNT_LIMIT,)
+                )
+                return cursor.fetchone()[0]
         
         try:
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            query = "SELECT id, title, completed FROM tasks WHERE completed = FALSE ORDER BY id ASC"
-            cursor.execute(query)
-            tasks = cursor.fetchall()
-            cursor.close()
-            return tasks
-        except psycopg2.Error as e:
-            print(f"タスク取得エラー: {e}")
-            return []
+            return await self._run(query)
+        except (psycopg2.Error, asyncio.TimeoutError) as e:
+            print(f"タスク数取得エラー: {e!r}")
+            return None
     
-    def toggle_task_completion(self, task_id):
-        """タスクの完了状態を切り替え"""
-        if not self.connection or self.connection.closed:
-            return False
+    async def complete_task(self, task_id):
+        """タスクを完了にする
+        
+        未完了の場合だけ更新するので、古い一覧から選んでも完了済みのタスクを未完了に戻すことはない。
+        戻り値は True（完了にした）/ False（既に完了済み、または存在しない）/ None（エラー）。
+        """
+        def query(conn, task_id):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE tasks SET completed = TRUE WHERE id = %s AND completed = FALSE RETURNING id",
+                    (task_id,)
+                )
+                result = cursor.fetchone()
+            conn.commit()
+            return result is not None
         
         try:
-            cursor = self.connection.cursor()
-            # 現在の状態を取得
-            cursor.execute("SELECT completed FROM tasks WHERE id = %s", (task_id,))
-            result = cursor.fetchone()
-            if not result:
-                cursor.close()
-                return False
-            
-            # 状態を反転
-            new_status = not result[0]
-            cursor.execute("UPDATE tasks SET completed = %s WHERE id = %s", (new_status, task_id))
-            self.connection.commit()
-            cursor.close()
-            
-            status_text = "完了" if new_status else "未完了"
-            print(f"タスクID={task_id}を{status_text}に変更しました")
-            return True
-        except psycopg2.Error as e:
-            print(f"タスク更新エラー: {e}")
-            return False
+            completed = await self._run(query, task_id)
+        except (psycopg2.Error, asyncio.TimeoutError) as e:
+            print(f"タスク更新エラー: {e!r}")
+            return None
+        
+        if completed:
+            print(f"タスクID={task_id}を完了に変更しました")
+        return completed
 
 # タスクマネージャーのインスタンス作成
 task_manager = TaskManager(DB_CONFIG)
@@ -123,15 +250,14 @@ async def on_ready():
     print(f'対象ギルドID: {TARGET_GUILD_ID}')
     
     # データベース接続
-    if task_manager.connect():
+    if await task_manager.connect():
         print("タスク管理Bot準備完了")
     else:
         print("警告: データベースに接続できませんでした")
     
     print('📝 リアクション式タスク管理Bot')
     print('👍 = タスク作成')
-    print('❤️ = 未完了タスク一覧表示')
-    print('✅ = タスク完了切り替え')
+    print('❤️ = 未完了タスク一覧表示（ページ表示・メニューで完了）')
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -153,13 +279,9 @@ async def on_raw_reaction_add(payload):
         if str(payload.emoji) == '👍':
             await handle_task_creation(channel, payload)
         
-        # ❤️リアクション: タスク一覧表示
+        # ❤️リアクション: タスク一覧表示（完了は一覧のセレクトメニューで行う）
         elif str(payload.emoji) == '❤️':
             await handle_task_list_display(channel, payload)
-        
-        # ✅リアクション: タスク完了切り替え
-        elif str(payload.emoji) == '✅':
-            await handle_task_completion_toggle(channel, payload)
             
     except Exception as e:
         print(f"リアクション処理中にエラー: {e}")
@@ -176,7 +298,7 @@ async def handle_task_creation(channel, payload):
             return
         
         # タスクを作成
-        task_id = task_manager.create_task(message.content)
+        task_id = await task_manager.create_task(message.content)
         if task_id:
             embed = discord.Embed(
                 title="📝 タスク作成完了",
@@ -198,87 +320,148 @@ async def handle_task_creation(channel, payload):
         print(f"タスク作成エラー: {e}")
         await channel.send("❌ タスク作成中にエラーが発生しました", delete_after=5)
 
-async def handle_task_list_display(channel, payload):
-    """❤️リアクションによるタスク一覧表示処理"""
-    try:
-        # 未完了タスクのみを取得
-        tasks = task_manager.get_incomplete_tasks()
+class TaskListView(discord.ui.View):
+    """1つのメッセージでタスク一覧をページ表示するビュー
+    
+    ページ送り・完了切り替えはボタン/セレクトメニューで行い、同じメッセージを編集する。
+    ページはキーセット（直前のページ最後のタスクID）で取得するので、表示中のページ分しか読み込まない。
+    """
+    
+    def __init__(self):
+        super().__init__(timeout=600)
+        self.page_starts = [0]  # 各ページの取得開始位置（直前のページ最後のタスクID）
+        self.tasks = []
+        self.has_more = False
+        self.total_estimate = None
+        self.message = None
+    
+    @property
+    def page(self):
+        return len(self.page_starts) - 1
+    
+    async def load(self, with_estimate=False):
+        """現在のページを読み込む"""
+        if with_estimate:
+            (self.tasks, self.has_more), self.total_estimate = await asyncio.gather(
+                task_manager.get_incomplete_tasks_page(self.page_starts[-1]),
+                task_manager.estimate_incomplete_task_count()
+            )
+        else:
+            self.tasks, self.has_more = await task_manager.get_incomplete_tasks_page(self.page_starts[-1])
         
-        if not tasks:
-            embed = discord.Embed(
+        # 完了にしてページが空になった場合は前のページに戻る
+        while not self.tasks and self.page > 0:
+            self.page_starts.pop()
+            self.tasks, self.has_more = await task_manager.get_incomplete_tasks_page(self.page_starts[-1])
+        
+        self.refresh_components()
+    
+    def build_embed(self):
+        """現在のページのEmbedを作成"""
+        if not self.tasks:
+            return discord.Embed(
                 title="📋 未完了タスク一覧",
                 description="現在未完了のタスクはありません🎉",
                 color=discord.Color.green()
             )
-            await channel.send(embed=embed, delete_after=10)
-            return
         
-        # 各タスクを個別のメッセージとして投稿
-        await channel.send(f"📋 **未完了タスク一覧** ({len(tasks)}件)")
+        lines = []
+        for task in self.tasks:
+            title = task['title'] if len(task['title']) <= 80 else task['title'][:80] + "..."
+            lines.append(f"📝 **#{task['id']}** {title}")
         
-        for task in tasks:
-            embed = discord.Embed(
-                title=f"📝 タスク#{task['id']}",
-                description=task['title'],
-                color=discord.Color.blue()
-            )
-            embed.add_field(
-                name="状態",
-                value="未完了",
-                inline=True
-            )
-            embed.set_footer(text=f"ID: {task['id']} | ✅で完了にする")
-            
-            # メッセージを送信し、✅リアクションを追加
-            sent_message = await channel.send(embed=embed)
-            await sent_message.add_reaction('✅')
-            
-    except Exception as e:
-        print(f"タスク一覧表示エラー: {e}")
-        await channel.send("❌ タスク一覧の表示中にエラーが発生しました", delete_after=5)
-
-async def handle_task_completion_toggle(channel, payload):
-    """✅リアクションによるタスク完了切り替え処理"""
-    try:
-        # Botが送信したメッセージかチェック
-        message = await channel.fetch_message(payload.message_id)
-        if message.author.id != bot.user.id:
-            return  # Botのメッセージでない場合は無視
+        total_text = f" (約{self.total_estimate}件)" if self.total_estimate is not None else ""
+        embed = discord.Embed(
+            title=f"📋 未完了タスク一覧{total_text}",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"ページ {self.page + 1} | メニューからタスクを選ぶと完了にします")
+        return embed
+    
+    def refresh_components(self):
+        """ページに合わせてボタンとセレクトメニューを更新"""
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not self.has_more
         
-        # メッセージのEmbedからタスクIDを抽出
-        if not message.embeds:
+        options = [
+            discord.SelectOption(
+                label=f"#{task['id']} {task['title']}"[:100],
+                value=str(task['id'])
+            )
+            for task in self.tasks
+        ]
+        self.complete_task.options = options or [discord.SelectOption(label="タスクなし", value="0")]
+        self.complete_task.disabled = not options
+    
+    async def update(self, interaction, with_estimate=False):
+        """現在のページを読み込んでメッセージを編集"""
+        await self.load(with_estimate)
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+    
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary, row=1)
+    async def previous_page(self, interaction, button):
+        if self.page > 0:
+            self.page_starts.pop()
+        await self.update(interaction)
+    
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction, button):
+        if self.tasks:
+            self.page_starts.append(self.tasks[-1]['id'])
+        await self.update(interaction)
+    
+    @discord.ui.button(label="🔄 更新", style=discord.ButtonStyle.secondary, row=1)
+    async def reload(self, interaction, button):
+        await self.update(interaction, with_estimate=True)
+    
+    @discord.ui.select(placeholder="✅ 完了にするタスクを選択", row=0)
+    async def complete_task(self, interaction, select):
+        task_id = int(select.values[0])
+        completed = await task_manager.complete_task(task_id)
+        if completed is None:
+            await interaction.response.send_message(f"❌ タスク#{task_id} の完了に失敗しました", ephemeral=True)
             return
         
-        embed = message.embeds[0]
-        if not embed.title or "タスク#" not in embed.title:
-            return
+        if completed and self.total_estimate:
+            self.total_estimate -= 1
         
-        try:
-            # タイトルからタスクIDを抽出 (例: "✅ タスク#123" → 123)
-            task_id_str = embed.title.split("タスク#")[1].split()[0]
-            task_id = int(task_id_str)
-        except (IndexError, ValueError):
-            return
+        # 現在のページを読み直して同じメッセージを更新
+        await self.update(interaction)
+        if not completed:
+            # 一覧が古く、他の人が既に完了にしていた場合
+            await interaction.followup.send(f"ℹ️ タスク#{task_id} は既に完了しています", ephemeral=True)
+    
+    async def on_timeout(self):
+        """操作期限切れ時はボタンを外す"""
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+async def handle_task_list_display(channel, payload):
+    """❤️リアクションによるタスク一覧表示処理"""
+    try:
+        # 最初のページと未完了タスク数の概算を取得
+        view = TaskListView()
+        await view.load(with_estimate=True)
         
-        # タスクの完了状態を切り替え
-        if task_manager.toggle_task_completion(task_id):
-            # 成功メッセージを送信
-            await channel.send(f"✅ タスク#{task_id} の状態を切り替えました", delete_after=5)
-            
-            # 新しいタスク一覧を表示
-            await handle_task_list_display(channel, payload)
-        else:
-            await channel.send(f"❌ タスク#{task_id} の状態切り替えに失敗しました", delete_after=5)
+        # 1つのメッセージにページ表示（以降の操作はこのメッセージの編集のみ）
+        view.message = await channel.send(embed=view.build_embed(), view=view if view.tasks else None)
+        
+        # 従来方式（見出し + タスクごとに送信と✅追加）では 1 + 2×件数 回のAPIコールが必要だった
+        if view.total_estimate is not None:
+            print(f"タスク一覧を表示しました: 約{view.total_estimate}件 / APIコール1回（従来方式: {1 + 2 * view.total_estimate}回）")
             
     except Exception as e:
-        print(f"タスク完了切り替えエラー: {e}")
-        await channel.send("❌ タスク状態の切り替え中にエラーが発生しました", delete_after=5)
+        print(f"タスク一覧表示エラー: {e}")
+        await channel.send("❌ タスク一覧の表示中にエラーが発生しました", delete_after=5)
 
 @bot.event
 async def on_disconnect():
-    """Bot切断時の処理"""
+    """Bot切断時の処理（ゲートウェイの再接続でも呼ばれるので、DB接続は閉じない）"""
     print("Botが切断されました")
-    task_manager.disconnect()
 
 @bot.event
 async def on_error(event, *args, **kwargs):
@@ -309,8 +492,7 @@ if __name__ == "__main__":
     print('📝 リアクション式タスク管理Botを起動します...')
     print('使い方:')
     print('  👍 メッセージにリアクション → タスク作成')
-    print('  ❤️ メッセージにリアクション → 未完了タスク一覧表示')
-    print('  ✅ Botのタスクメッセージにリアクション → 完了切り替え')
+    print('  ❤️ メッセージにリアクション → 未完了タスク一覧表示（ボタンでページ送り、メニューで完了）')
     print(f'対象サーバー: {TARGET_GUILD_ID}')
     print(f'データベース: {DB_CONFIG["host"]}')
     
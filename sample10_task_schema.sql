@@ -15,7 +15,10 @@ COMMENT ON COLUMN tasks.title IS 'タスクタイトル（元メッセージの
 COMMENT ON COLUMN tasks.completed IS '完了状態（false=未完了, true=完了）';
 
 -- インデックスの作成（パフォーマンス向上）
-CREATE INDEX IF NOT EXISTS idx_tasks_completed ON tasks(completed);
+-- 一覧表示は「未完了タスクをID順にページ取得」なので、未完了の行だけを持つ部分インデックスを使う
+-- （completed 列だけのインデックスは真偽値で選択性が低く、件数が増えると役に立たない）
+DROP INDEX IF EXISTS idx_tasks_completed;
+CREATE INDEX IF NOT EXISTS idx_tasks_incomplete ON tasks(id) WHERE completed = FALSE;
 
 -- サンプルデータ（テスト用、必要に応じて削除）
 INSERT INTO tasks (title, completed) VALUES 
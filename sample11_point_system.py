@@ -3,7 +3,10 @@ import discord
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
+import asyncio
+import bisect
 import psycopg2
+from member_cache import MemberResolver
 
 load_dotenv()
 
@@ -22,12 +25,62 @@ DB_CONFIG = {
 # 対象のギルドID
 TARGET_GUILD_ID = 1394139562028306644
 
+# ランキングで表示する人数
+RANKING_SIZE = 10
+
+# ポイント付与のバッチ設定（この時間内に届いた付与をまとめて1回で書き込む）
+GRANT_BATCH_WINDOW_MS = 50
+GRANT_BATCH_MAX_SIZE = 100
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.reactions = True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# ポイント付与クエリ
+# point_grants への INSERT が成功した場合のみ user_points を加算し、加算後のポイントを返す
+GRANT_POINT_QUERY = """
+    WITH new_grant AS (
+        INSERT INTO point_grants (message_id, giver_user_id, receiver_user_id)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (message_id, giver_user_id) DO NOTHING
+        RETURNING receiver_user_id
+    )
+    INSERT INTO user_points (user_id, points, updated_at)
+    SELECT receiver_user_id, 1, CURRENT_TIMESTAMP FROM new_grant
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        points = user_points.points + 1,
+        updated_at = CURRENT_TIMESTAMP
+    RETURNING points
+"""
+
+# まとめてポイント付与するクエリ
+# 付与履歴を複数行まとめて INSERT し（重複は除外）、受信者ごとに集計した件数で user_points を1回だけ加算する
+GRANT_POINTS_BATCH_QUERY = """
+    WITH new_grants AS (
+        INSERT INTO point_grants (message_id, giver_user_id, receiver_user_id)
+        SELECT * FROM unnest(%s::BIGINT[], %s::BIGINT[], %s::BIGINT[])
+        ON CONFLICT (message_id, giver_user_id) DO NOTHING
+        RETURNING message_id, giver_user_id, receiver_user_id
+    ),
+    totals AS (
+        INSERT INTO user_points (user_id, points, updated_at)
+        SELECT receiver_user_id, COUNT(*), CURRENT_TIMESTAMP
+        FROM new_grants
+        GROUP BY receiver_user_id
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            points = user_points.points + EXCLUDED.points,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING user_id, points
+    )
+    SELECT new_grants.message_id, new_grants.giver_user_id, totals.points
+    FROM new_grants
+    JOIN totals ON totals.user_id = new_grants.receiver_user_id
+"""
+
 class PointSystem:
     """ポイントシステム管理クラス"""
     
@@ -39,6 +92,8 @@ class PointSystem:
         """データベースに接続"""
         try:
             self.connection = psycopg2.connect(**self.config)
+            # 各処理は1文で完結するため自動コミットにして COMMIT の往復を省く
+            self.connection.autocommit = True
             print(f"Supabase PostgreSQLに接続しました: {self.config['host']}")
             return True
         except psycopg2.Error as e:
@@ -63,47 +118,94 @@ class PointSystem:
         try:
             cursor = self.connection.cursor()
             
-            # 重複チェック（同じメッセージに同じユーザーからのポイント付与があるか）
-            cursor.execute(
-                "SELECT 1 FROM point_grants WHERE message_id = %s AND giver_user_id = %s",
-                (message_id, giver_user_id)
-            )
-            if cursor.fetchone():
-                cursor.close()
-                return False, "このメッセージには既にポイントを付与済みです"
-            
-            # ポイント付与履歴を記録
-            cursor.execute(
-                "INSERT INTO point_grants (message_id, giver_user_id, receiver_user_id) VALUES (%s, %s, %s)",
-                (message_id, giver_user_id, receiver_user_id)
-            )
-            
-            # ユーザーポイントテーブルを更新（UPSERT）
-            cursor.execute("""
-                INSERT INTO user_points (user_id, points, updated_at) 
-                VALUES (%s, 1, CURRENT_TIMESTAMP)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    points = user_points.points + 1,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (receiver_user_id,))
-            
-            # 更新後のポイント数を取得
-            cursor.execute("SELECT points FROM user_points WHERE user_id = %s", (receiver_user_id,))
-            new_points = cursor.fetchone()[0]
-            
-            self.connection.commit()
+            # 履歴の記録（重複時は何もしない）とポイント加算を1文・1往復で実行する
+            # 重複の場合は point_grants に行が入らないため、加算も行われず結果が空になる
+            cursor.execute(GRANT_POINT_QUERY, (message_id, giver_user_id, receiver_user_id))
+            result = cursor.fetchone()
             cursor.close()
             
+            if not result:
+                return False, "このメッセージには既にポイントを付与済みです"
+            
+            new_points = result[0]
             print(f"ポイント付与: {giver_user_id} → {receiver_user_id} (合計: {new_points}pt)")
             return True, new_points
             
         except psycopg2.Error as e:
             print(f"ポイント付与エラー: {e}")
-            if self.connection:
-                self.connection.rollback()
             return False, "ポイント付与に失敗しました"
     
+    def grant_points_batch(self, grants):
+        """複数のポイント付与を1回の書き込みで処理
+        
+        grants は (giver_user_id, receiver_user_id, message_id) のリスト（受付順）。
+        各付与について (成功したか, 付与後のポイント or エラーメッセージ) のリストを同じ順で返す。
+        """
+        if not self.connection or self.connection.closed:
+            return [(False, "データベース接続エラー")] * len(grants)
+        
+        # 同じバッチ内の重複（同じメッセージに同じユーザーから）は先着のみ送る
+        unique_grants = {}
+        for giver_user_id, receiver_user_id, message_id in grants:
+            unique_grants.setdefault((message_id, giver_user_id), receiver_user_id)
+        
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(GRANT_POINTS_BATCH_QUERY, (
+                [message_id for message_id, _ in unique_grants],
+                [giver_user_id for _, giver_user_id in unique_grants],
+                list(unique_grants.values())
+            ))
+            rows = cursor.fetchall()
+            cursor.close()
+        except psycopg2.Error as e:
+            print(f"ポイント一括付与エラー: {e}")
+            return [(False, "ポイント付与に失敗しました")] * len(grants)
+        
+        # 新たに付与できた (message_id, giver_user_id) と、受信者ごとの加算後ポイント
+        granted = set()
+        final_points = {}
+        for message_id, giver_user_id, points in rows:
+            granted.add((message_id, giver_user_id))
+            final_points[unique_grants[(message_id, giver_user_id)]] = points
+        
+        # 受信者ごとの今回の付与件数
+        remaining = {}
+        for key in granted:
+            receiver_user_id = unique_grants[key]
+            remaining[receiver_user_id] = remaining.get(receiver_user_id, 0) + 1
+        
+        # 受付順に「その付与が反映された時点」の合計ポイントを割り当てる
+        results = []
+        for giver_user_id, receiver_user_id, message_id in grants:
+            key = (message_id, giver_user_id)
+            if key not in granted:
+                results.append((False, "このメッセージには既にポイントを付与済みです"))
+                continue
+            granted.discard(key)
+            remaining[receiver_user_id] -= 1
+            new_points = final_points[receiver_user_id] - remaining[receiver_user_id]
+            print(f"ポイント付与: {giver_user_id} → {receiver_user_id} (合計: {new_points}pt)")
+            results.append((True, new_points))
+        
+        return results
+    
+    def get_ranking(self):
+        """ランキング全体を (user_id, points) のリストで取得（起動時の初期化用）"""
+        if not self.connection or self.connection.closed:
+            return []
+        
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT user_id, points FROM point_ranking")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+            
+        except psycopg2.Error as e:
+            print(f"ランキング取得エラー: {e}")
+            return []
+    
     def get_user_points(self, user_id):
         """ユーザーの現在ポイントを取得"""
         if not self.connection or self.connection.closed:
@@ -121,8 +223,122 @@ class PointSystem:
             print(f"ポイント取得エラー: {e}")
             return 0
 
+class PointGrantQueue:
+    """ポイント付与をまとめて書き込むキュー
+    
+    短い時間（window_ms）内に届いた付与、または max_batch 件に達した付与を
+    PointSystem.grant_points_batch で1回の書き込みにまとめる。
+    呼び出し元には付与ごとの結果をそのまま返す。
+    """
+    
+    def __init__(self, point_system, window_ms=GRANT_BATCH_WINDOW_MS, max_batch=GRANT_BATCH_MAX_SIZE):
+        self.point_system = point_system
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.worker = None
+    
+    def start(self):
+        """バッチ書き込みタスクを開始"""
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+    
+    async def grant(self, giver_user_id, receiver_user_id, message_id):
+        """ポイント付与をキューに入れ、書き込み結果を待つ"""
+        # 自分に自分でポイントを付与することを防ぐ
+        if giver_user_id == receiver_user_id:
+            return False, "自分にはポイントを付与できません"
+        
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((giver_user_id, receiver_user_id, message_id), future))
+        return await future
+    
+    async def _run(self):
+        """キューから付与を集めて一括で書き込む"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            
+            # 期限までに届いた付与を最大 max_batch 件まで集める
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            grants = [grant for grant, _ in batch]
+            try:
+                # DB書き込みはイベントループを止めないようにスレッドで実行
+                results = await asyncio.to_thread(self.point_system.grant_points_batch, grants)
+            except Exception as e:
+                print(f"ポイント一括付与エラー: {e}")
+                results = [(False, "ポイント付与に失敗しました")] * len(batch)
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class PointRanking:
+    """メモリ上で管理するポイントランキング
+    
+    起動時に point_ranking ビューから読み込み、以降はポイント付与のたびに更新する。
+    並び順はビューと同じ（ポイントの多い順、同点なら先に到達した順）で、
+    ランキング表示・順位確認でデータベースにアクセスしない。
+    """
+    
+    def __init__(self):
+        self.entries = []  # (-ポイント, 到達順, ユーザーID) の昇順リスト
+        self.keys = {}  # ユーザーID -> entries 内のキー
+        self.sequence = 0
+    
+    def load(self, rows):
+        """(user_id, points) のリスト（ビューの並び順）で初期化"""
+        self.entries = []
+        self.keys = {}
+        for sequence, (user_id, points) in enumerate(rows):
+            key = (-points, sequence, user_id)
+            self.entries.append(key)
+            self.keys[user_id] = key
+        self.entries.sort()
+        self.sequence = len(self.entries)
+    
+    def update(self, user_id, points):
+        """ユーザーのポイントを更新（ポイントは増える一方なので、古い値での更新は無視）"""
+        old_key = self.keys.get(user_id)
+        if old_key:
+            if -old_key[0] >= points:
+                return
+            del self.entries[bisect.bisect_left(self.entries, old_key)]
+        
+        key = (-points, self.sequence, user_id)
+        self.sequence += 1
+        bisect.insort(self.entries, key)
+        self.keys[user_id] = key
+    
+    def top(self, n=RANKING_SIZE):
+        """上位n人の (順位, ユーザーID, ポイント) のリスト"""
+        return [(rank, user_id, -points) for rank, (points, _, user_id) in enumerate(self.entries[:n], 1)]
+    
+    def rank(self, user_id):
+        """ユーザーの (順位, ポイント)（ランキング外の場合は None）"""
+        key = self.keys.get(user_id)
+        if not key:
+            return None
+        return bisect.bisect_left(self.entries, key) + 1, -key[0]
+    
+    def __len__(self):
+        return len(self.entries)
+
 # ポイントシステムのインスタンス作成
 point_system = PointSystem(DB_CONFIG)
+grant_queue = PointGrantQueue(point_system)
+member_resolver = MemberResolver()
+point_ranking = PointRanking()
 
 @bot.event
 async def on_ready():
@@ -132,13 +348,26 @@ async def on_ready():
     
     # データベース接続
     if point_system.connect():
+        grant_queue.start()
+        
+        # ランキングをデータベースから読み込み
+        point_ranking.load(await asyncio.to_thread(point_system.get_ranking))
+        print(f"ランキングを読み込みました: {len(point_ranking)}人")
         print("ポイントシステムBot準備完了")
     else:
         print("警告: データベースに接続できませんでした")
     
+    # スラッシュコマンドを対象ギルドに同期
+    try:
+        synced = await bot.tree.sync(guild=discord.Object(id=TARGET_GUILD_ID))
+        print(f'{len(synced)}個のスラッシュコマンドを同期しました')
+    except Exception as e:
+        print(f'スラッシュコマンドの同期に失敗しました: {e}')
+    
     print('💎 リアクション式ポイントシステムBot')
     print('👍 = ポイント付与（投稿者に1pt）')
     print('❤️ = ポイント確認（自分の現在pt）')
+    print('/ranking = ポイントランキング / /my_rank = 自分の順位')
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -183,23 +412,15 @@ async def handle_point_grant(channel, payload):
             print(f"ギルドが見つかりません: {payload.guild_id}")
             return
             
-        # メンバー情報を取得（管理者など特権ユーザーも含む）
+        # メンバー情報を取得（キャッシュ優先、見つからない場合のみAPIから取得）
         try:
-            giver = await guild.fetch_member(payload.user_id)
-        except discord.NotFound:
-            print(f"付与者のメンバー情報を取得できません: {payload.user_id}")
-            giver = None
+            giver, receiver = await asyncio.gather(
+                member_resolver.resolve(guild, payload.user_id),
+                member_resolver.resolve(guild, message.author.id)
+            )
         except discord.Forbidden:
-            # 権限不足の場合はget_memberで試す
+            # 権限不足の場合はキャッシュのみで試す
             giver = guild.get_member(payload.user_id)
-            
-        try:
-            receiver = await guild.fetch_member(message.author.id)
-        except discord.NotFound:
-            print(f"受信者のメンバー情報を取得できません: {message.author.id}")
-            receiver = None
-        except discord.Forbidden:
-            # 権限不足の場合はget_memberで試す
             receiver = guild.get_member(message.author.id)
         
         # どちらかのメンバー情報が取得できない場合はログ出力して処理続行
@@ -210,14 +431,16 @@ async def handle_point_grant(channel, payload):
             # 受信者情報が必須なので、取得できない場合は処理を停止
             return
         
-        # ポイント付与実行
-        success, result = point_system.grant_point(
+        # ポイント付与実行（キュー経由でまとめて書き込み）
+        success, result = await grant_queue.grant(
             payload.user_id, 
             message.author.id, 
             payload.message_id
         )
         
         if success:
+            point_ranking.update(message.author.id, result)
+            
             # 成功時のEmbed
             embed = discord.Embed(
                 title="👍 ポイント付与完了",
@@ -263,15 +486,11 @@ async def handle_point_check(channel, payload):
             print(f"ギルドが見つかりません: {payload.guild_id}")
             return
             
-        # メンバー情報を取得（管理者など特権ユーザーも含む）
+        # メンバー情報を取得（キャッシュ優先、見つからない場合のみAPIから取得）
         try:
-            user = await guild.fetch_member(payload.user_id)
-        except discord.NotFound:
-            print(f"ユーザーのメンバー情報を取得できません: {payload.user_id}")
-            user = None
+            user = await member_resolver.resolve(guild, payload.user_id)
         except discord.Forbidden:
-            # 権限不足の場合はget_memberで試す
-            user = guild.get_member(payload.user_id)
+            user = None
         
         if not user:
             print(f"警告: ユーザーのメンバー情報が取得できませんでした（ID: {payload.user_id}）")
@@ -299,6 +518,54 @@ async def handle_point_check(channel, payload):
     except Exception as e:
         print(f"ポイント確認エラー: {e}")
 
+@bot.tree.command(name="ranking", description="ポイントランキングを表示します", guild=discord.Object(id=TARGET_GUILD_ID))
+async def ranking_command(interaction: discord.Interaction):
+    """ポイントランキング（メモリ上のランキングから表示）"""
+    top_users = point_ranking.top(RANKING_SIZE)
+    
+    if not top_users:
+        await interaction.response.send_message("まだポイントを持っているユーザーはいません", ephemeral=True)
+        return
+    
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    lines = []
+    for rank, user_id, points in top_users:
+        member = interaction.guild.get_member(user_id) if interaction.guild else None
+        name = member.display_name if member else f"<@{user_id}>"
+        lines.append(f"{medals.get(rank, f'{rank}.')} **{name}** - 💎 {points}pt")
+    
+    embed = discord.Embed(
+        title="🏆 ポイントランキング",
+        description="\n".join(lines),
+        color=discord.Color.gold()
+    )
+    
+    my_rank = point_ranking.rank(interaction.user.id)
+    if my_rank:
+        embed.set_footer(text=f"あなたの順位: {my_rank[0]}位 / {len(point_ranking)}人 ({my_rank[1]}pt)")
+    
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="my_rank", description="自分のポイント順位を表示します", guild=discord.Object(id=TARGET_GUILD_ID))
+async def my_rank_command(interaction: discord.Interaction):
+    """自分の順位（メモリ上のランキングから表示）"""
+    my_rank = point_ranking.rank(interaction.user.id)
+    
+    if not my_rank:
+        await interaction.response.send_message("まだポイントがありません。👍をもらってランキングに参加しよう！", ephemeral=True)
+        return
+    
+    rank, points = my_rank
+    embed = discord.Embed(
+        title="🏅 あなたの順位",
+        description=f"**{interaction.user.display_name}** さんは **{rank}位** / {len(point_ranking)}人",
+        color=discord.Color.gold()
+    )
+    embed.add_field(name="現在のポイント", value=f"💎 {points}pt", inline=False)
+    embed.set_thumbnail(url=interaction.user.display_avatar.url)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.event
 async def on_disconnect():
     """Bot切断時の処理"""
@@ -335,6 +602,7 @@ if __name__ == "__main__":
     print('使い方:')
     print('  👍 メッセージにリアクション → 投稿者に1ポイント付与')
     print('  ❤️ メッセージにリアクション → 自分の現在ポイント確認')
+    print('  /ranking → ポイントランキング表示、/my_rank → 自分の順位表示')
     print(f'対象サーバー: {TARGET_GUILD_ID}')
     print(f'データベース: {DB_CONFIG["host"]}')
     
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+sample11_point_system.py のポイント付与処理のベンチマーク
+
+旧実装（重複SELECT → INSERT → UPSERT → 再SELECT の4往復）と
+現在の PointSystem.grant_point（1文・1往復）の grants/sec を比較します。
+
+ローカルの PostgreSQL に sample11_point_system_schema.sql を適用してから実行してください。
+テストデータは負のIDで作成し、終了時に削除します。
+
+    BENCH_DB_HOST=localhost BENCH_DB_USER=postgres BENCH_DB_PASSWORD=postgres \\
+    python sample11_point_system_benchmark.py --grants 2000
+"""
+import argparse
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+from sample11_point_system import PointSystem
+
+load_dotenv()
+
+# ベンチマーク用データベース設定（ローカルPostgreSQLを想定）
+BENCH_DB_CONFIG = {
+    'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+    'database': os.getenv('BENCH_DB_DATABASE', 'postgres'),
+    'user': os.getenv('BENCH_DB_USER', 'postgres'),
+    'password': os.getenv('BENCH_DB_PASSWORD', ''),
+    'port': int(os.getenv('BENCH_DB_PORT', 5432)),
+    'sslmode': os.getenv('BENCH_DB_SSLMODE', 'prefer')
+}
+
+# 受信者の人数（UPSERTが同じ行に集中しすぎないように分散させる）
+RECEIVER_COUNT = 50
+
+
+def legacy_grant_point(connection, giver_user_id, receiver_user_id, message_id):
+    """旧実装（4往復 + COMMIT）"""
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT 1 FROM point_grants WHERE message_id = %s AND giver_user_id = %s",
+        (message_id, giver_user_id)
+    )
+    if cursor.fetchone():
+        cursor.close()
+        return False, "このメッセージには既にポイントを付与済みです"
+
+    cursor.execute(
+        "INSERT INTO point_grants (message_id, giver_user_id, receiver_user_id) VALUES (%s, %s, %s)",
+        (message_id, giver_user_id, receiver_user_id)
+    )
+    cursor.execute("""
+        INSERT INTO user_points (user_id, points, updated_at)
+        VALUES (%s, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            points = user_points.points + 1,
+            updated_at = CURRENT_TIMESTAMP
+    """, (receiver_user_id,))
+    cursor.execute("SELECT points FROM user_points WHERE user_id = %s", (receiver_user_id,))
+    new_points = cursor.fetchone()[0]
+    connection.commit()
+    cursor.close()
+    return True, new_points
+
+
+def cleanup(connection):
+    """ベンチマーク用データ（負のID）を削除"""
+    connection.rollback()
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM point_grants WHERE message_id < 0")
+        cursor.execute("DELETE FROM user_points WHERE user_id < 0")
+    connection.commit()
+
+
+def run(label, grant, grants, message_offset):
+    """grants 回のポイント付与を実行して grants/sec を返す"""
+    start = time.perf_counter()
+    for i in range(grants):
+        message_id = -(message_offset + i + 1)
+        giver_user_id = -1_000_000 - (i % 7)
+        receiver_user_id = -(i % RECEIVER_COUNT) - 1
+        success, result = grant(giver_user_id, receiver_user_id, message_id)
+        if not success:
+            raise RuntimeError(f"{label}: 付与に失敗しました: {result}")
+
+    # 重複付与（全件スキップされるはず）
+    for i in range(grants):
+        message_id = -(message_offset + i + 1)
+        giver_user_id = -1_000_000 - (i % 7)
+        receiver_user_id = -(i % RECEIVER_COUNT) - 1
+        success, _ = grant(giver_user_id, receiver_user_id, message_id)
+        if success:
+            raise RuntimeError(f"{label}: 重複付与が成功してしまいました")
+
+    elapsed = time.perf_counter() - start
+    rate = grants * 2 / elapsed
+    print(f"{label:<24} {grants * 2:>7}件 {elapsed:>8.2f}秒 {rate:>10.1f} grants/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ポイント付与処理のベンチマーク')
+    parser.add_argument('--grants', type=int, default=1000, help='新規付与の件数（同数の重複付与も実行）')
+    args = parser.parse_args()
+
+    legacy_connection = psycopg2.connect(**BENCH_DB_CONFIG)
+    point_system = PointSystem(BENCH_DB_CONFIG)
+    if not point_system.connect():
+        return
+
+    try:
+        cleanup(legacy_connection)
+        print(f"ベンチマーク: 新規付与{args.grants}件 + 重複付与{args.grants}件")
+        before = run(
+            '旧実装（4往復）',
+            lambda g, r, m: legacy_grant_point(legacy_connection, g, r, m),
+            args.grants,
+            0
+        )
+
+        cleanup(legacy_connection)
+        after = run('現在の実装（1往復）', point_system.grant_point, args.grants, 0)
+
+        print(f"改善率: {after / before:.2f}倍")
+    finally:
+        cleanup(legacy_connection)
+        legacy_connection.close()
+        point_system.disconnect()
+
+
+if __name__ == '__main__':
+    main()
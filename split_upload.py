@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+サンプル共通のファイル分割アップロード
+
+エクスポート内容を書き込みながら、Discordのアップロード上限を超えた時点で
+gzip圧縮に切り替え、上限以下のパートに分割して1つずつアップロードする。
+ファイル全体をディスクに書き出したり、メモリに溜めたりしない（保持するのは1パート分のみ）。
+圧縮はイベントループを止めないように、upload_ready / close の中でスレッドに渡して行う
+（write は書き込まれたデータを溜めるだけなので、csv.writer の書き込み先にもそのまま使える）。
+
+使い方:
+    from split_upload import SplitUploader
+
+    uploader = SplitUploader(channel, 'room_log.txt')
+    for chunk in chunks:
+        uploader.write(chunk)
+        await uploader.upload_ready()  # 溜まったデータを圧縮し、上限に達したパートがあれば送信
+    await uploader.close('ログをお送りします！')
+
+上限以下に収まった場合は、これまで通り圧縮せずに1ファイルとして送信する。
+"""
+import asyncio
+import gzip
+import io
+import zlib
+
+import discord
+
+# ギルドの上限が取得できない場合のアップロード上限
+DEFAULT_UPLOAD_LIMIT = 25 * 1024 * 1024  # 25MB
+
+# この量を書き込むごとに圧縮データを確定させ、パートサイズを正確に把握する
+FLUSH_INTERVAL = 1024 * 1024  # 1MB
+
+# 圧縮途中のデータ分の余裕（FLUSH_INTERVAL 分の入力が圧縮されずに増えても上限を超えないように）
+PART_MARGIN = 2 * FLUSH_INTERVAL
+
+
+class SplitUploader:
+    """上限を超えたらgzip圧縮・分割してアップロードする書き込み先"""
+
+    def __init__(self, channel, filename, limit=None):
+        self.channel = channel
+        self.filename = filename
+        guild = getattr(channel, 'guild', None)
+        self.limit = limit or getattr(guild, 'filesize_limit', None) or DEFAULT_UPLOAD_LIMIT
+
+        self.raw = io.BytesIO()  # 上限以下の間は圧縮せずに保持
+        self.compressing = False
+        self.part = None
+        self.gz = None
+        self.pending = 0
+        self.part_bytes = 0
+        self.part_count = 0
+        self.buffered = []  # 圧縮待ちのデータ（upload_ready / close でスレッド内で圧縮）
+        self.ready = []  # アップロード待ちの (ファイル名, データ)
+        self.uploaded_parts = 0
+        self.total_bytes = 0  # 圧縮前の合計サイズ
+
+    def write(self, data):
+        """データを書き込む（str は UTF-8 でエンコード）。csv.writer の書き込み先としても使える"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.total_bytes += len(data)
+
+        if not self.compressing:
+            self.raw.write(data)
+            if self.raw.tell() <= self.limit:
+                return
+            # 上限を超えたので、ここまでの内容を圧縮待ちにして分割モードに切り替える
+            data = self.raw.getvalue()
+            self.raw = None
+            self.compressing = True
+            self._start_part()
+
+        self.buffered.append(data)
+
+    def _compress(self, buffered):
+        """溜まったデータを圧縮する（スレッド内で実行）"""
+        for data in buffered:
+            for start in range(0, len(data), FLUSH_INTERVAL):
+                self._feed(data[start:start + FLUSH_INTERVAL])
+
+    async def _compress_buffered(self):
+        """溜まったデータをスレッドで圧縮"""
+        if self.buffered:
+            buffered, self.buffered = self.buffered, []
+            await asyncio.to_thread(self._compress, buffered)
+
+    def _start_part(self):
+        """新しいパートの圧縮を開始"""
+        self.part_count += 1
+        self.part = io.BytesIO()
+        self.gz = gzip.GzipFile(filename=self.filename, fileobj=self.part, mode='wb')
+        self.pending = 0
+        self.part_bytes = 0
+
+    def _feed(self, data):
+        """現在のパートに書き込み、上限に近づいたらパートを確定"""
+        self.gz.write(data)
+        self.pending += len(data)
+        self.part_bytes += len(data)
+        if self.pending >= FLUSH_INTERVAL:
+            self.gz.flush(zlib.Z_SYNC_FLUSH)
+            self.pending = 0
+            if self.part.tell() >= self.limit - PART_MARGIN:
+                self._finish_part()
+                self._start_part()
+
+    def _finish_part(self):
+        """現在のパートを確定してアップロード待ちに追加"""
+        self.gz.close()
+        name, ext = (self.filename.rsplit('.', 1) + [''])[:2]
+        part_filename = f'{name}.part{self.part_count:02d}.{ext}.gz' if ext else f'{name}.part{self.part_count:02d}.gz'
+        self.ready.append((part_filename, self.part.getvalue()))
+        self.part = None
+        self.gz = None
+
+    async def upload_ready(self):
+        """溜まったデータを圧縮し、確定済みのパートをアップロード"""
+        await self._compress_buffered()
+        while self.ready:
+            part_filename, data = self.ready.pop(0)
+            self.uploaded_parts += 1
+            await self.channel.send(
+                f'📦 パート{self.uploaded_parts}（{len(data):,}バイト、gzip圧縮）',
+                file=discord.File(io.BytesIO(data), part_filename)
+            )
+
+    async def close(self, content):
+        """残りを送信して完了メッセージを送る。戻り値は送信したファイル数"""
+        if not self.compressing:
+            await self.channel.send(content, file=discord.File(io.BytesIO(self.raw.getvalue()), self.filename))
+            self.raw = None
+            return 1
+
+        await self._compress_buffered()
+        if self.part_bytes:
+            await asyncio.to_thread(self._finish_part)
+        await self.upload_ready()
+        await self.channel.send(f'{content}\n（{self.uploaded_parts}個のgzipファイルに分割して送信しました）')
+        return self.uploaded_parts
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""model_router.py のテスト"""
+import asyncio
+import time
+
+import model_router
+from model_router import ModelRoute, ModelRouter
+
+
+def fixed_latency_stream(latency):
+    """latency 秒後に応答を始めるモデル"""
+    async def stream(model, request):
+        await asyncio.sleep(latency)
+        yield model
+    return stream
+
+
+def test_hedge_loser_sample_does_not_make_slower_route_win(monkeypatch):
+    """ヘッジで負けた短い経過時間は、遅いモデルを速く見せない"""
+    now = time.monotonic()
+    primary = ModelRoute('primary', fixed_latency_stream(0))
+    fallback = ModelRoute('fallback', fixed_latency_stream(0))
+    for _ in range(10):
+        primary.latencies.append((now, 0.2))
+        fallback.latencies.append((now, 0.3))
+        # 主モデルが応答を始める直前に送ったヘッジの経過時間
+        fallback.lower_bounds.append((now, 0.1))
+    router = ModelRouter([primary, fallback])
+
+    assert [route.model for route in router.select(now)] == ['primary', 'fallback']
+
+
+def test_hedge_losers_are_not_recorded_as_latency(monkeypatch):
+    """主モデル 0.2秒・フォールバック 0.3秒で、ヘッジが毎回負けても主モデルを使い続ける"""
+    monkeypatch.setattr(model_router, 'HEDGE_DEFAULT_DELAY', 0.1)
+    monkeypatch.setattr(model_router, 'HEDGE_MIN_DELAY', 0.1)
+    monkeypatch.setattr(model_router, 'HEDGE_MIN_SAMPLES', 1000)
+    primary = ModelRoute('primary', fixed_latency_stream(0.2))
+    fallback = ModelRoute('fallback', fixed_latency_stream(0.3))
+    router = ModelRouter([primary, fallback])
+
+    async def run():
+        winners = []
+        for _ in range(8):
+            winners.append(''.join([delta async for delta in router.stream({})]))
+        return winners
+
+    assert asyncio.run(run()) == ['primary'] * 8
+    assert fallback.hedges == 8
+    assert not fallback.latencies  # 下限は実測として記録しない
+    assert len(fallback.lower_bounds) == 8
+    assert router.select(time.monotonic())[0] is primary
+
+
+def test_route_always_losing_hedge_is_demoted():
+    """いつもヘッジで負ける遅いモデルは、実測がなくても順番を下げる"""
+    now = time.monotonic()
+    primary = ModelRoute('primary', fixed_latency_stream(0))
+    fallback = ModelRoute('fallback', fixed_latency_stream(0))
+    for _ in range(10):
+        primary.lower_bounds.append((now, 2.0))
+        fallback.latencies.append((now, 0.5))
+    router = ModelRouter([primary, fallback])
+
+    assert [route.model for route in router.select(now)] == ['fallback', 'primary']
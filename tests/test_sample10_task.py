@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""sample10_task.py のテスト"""
+import asyncio
+
+import sample10_task
+from sample10_task import TaskManager
+
+
+class FakeCursor:
+    """実行したSQLを記録し、用意した結果を順に返すカーソル"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.queries.append(sql)
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+
+class FakeConnection:
+    def __init__(self, results):
+        self.cursor_ = FakeCursor(results)
+
+    def cursor(self, *args, **kwargs):
+        return self.cursor_
+
+
+def estimate_with(results):
+    """統計情報・件数の結果を用意して estimate_incomplete_task_count を実行"""
+    connection = FakeConnection(results)
+    task_manager = TaskManager({})
+
+    async def run(func, *args):
+        return func(connection, *args)
+
+    task_manager._run = run
+    return asyncio.run(task_manager.estimate_incomplete_task_count()), connection.cursor_.queries
+
+
+def test_estimate_returns_exact_count_when_reltuples_is_stale():
+    """統計情報（reltuples）が実際の未完了件数より多くても、数えた件数を返す"""
+    count, queries = estimate_with([(500,), (3,)])
+    assert count == 3
+    assert len(queries) == 2
+
+
+def test_estimate_counts_when_reltuples_is_not_analyzed():
+    """インデックス作成直後（reltuples が0以下）は実際に数える"""
+    count, _ = estimate_with([(-1,), (7,)])
+    assert count == 7
+
+
+def test_estimate_uses_reltuples_for_large_tables():
+    """EXACT_COUNT_LIMIT 件以上なら数えずに統計情報を返す"""
+    count, queries = estimate_with([(sample10_task.EXACT_COUNT_LIMIT * 5,)])
+    assert count == sample10_task.EXACT_COUNT_LIMIT * 5
+    assert len(queries) == 1
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""split_upload.py のテスト"""
+import asyncio
+import gzip
+import os
+import threading
+
+import split_upload
+from split_upload import SplitUploader
+
+
+class FakeChannel:
+    """送信したファイルの中身を記録するチャンネル"""
+
+    def __init__(self):
+        self.files = []
+
+    async def send(self, content, file=None):
+        if file is not None:
+            self.files.append((file.filename, file.fp.read()))
+
+
+def test_compression_runs_off_event_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    compress_threads = set()
+    compress = SplitUploader._compress
+
+    def recording_compress(self, buffered):
+        compress_threads.add(threading.get_ident())
+        compress(self, buffered)
+
+    monkeypatch.setattr(SplitUploader, '_compress', recording_compress)
+
+    async def run():
+        channel = FakeChannel()
+        uploader = SplitUploader(channel, 'log.txt', limit=3 * split_upload.FLUSH_INTERVAL)
+        data = os.urandom(10 * split_upload.FLUSH_INTERVAL)  # 圧縮が効かないので複数パートに分かれる
+        for start in range(0, len(data), 256 * 1024):
+            uploader.write(data[start:start + 256 * 1024])
+            # write の時点では圧縮しない（上限を超えるまでは raw、超えた後は圧縮待ちに溜める）
+            assert uploader.buffered if uploader.compressing else uploader.raw
+            await uploader.upload_ready()
+        await uploader.close('done')
+        return channel, uploader, data
+
+    channel, uploader, data = asyncio.run(run())
+
+    assert compress_threads and loop_thread not in compress_threads
+    assert len(channel.files) > 1
+    assert all(len(content) <= uploader.limit for _, content in channel.files)
+    assert b''.join(gzip.decompress(content) for _, content in channel.files) == data
+
+
+def test_small_output_is_sent_uncompressed():
+    channel = FakeChannel()
+
+    async def run():
+        uploader = SplitUploader(channel, 'log.txt')
+        uploader.write('こんにちは\n')
+        await uploader.upload_ready()
+        return await uploader.close('done')
+
+    assert asyncio.run(run()) == 1
+    assert channel.files == [('log.txt', 'こんにちは\n'.encode('utf-8'))]